@@ -0,0 +1,111 @@
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patches import Patch
+
+from timeseries import minmax_indices
+
+
+def plot_stats(lake):
+    seasons = ["Spring", "Summer", "Fall", "Winter"]
+    fish_born = [lake.fish_born_per_season[season] for season in seasons]
+    fish_caught = [lake.fish_caught_per_season[season] for season in seasons]
+
+    x = np.arange(len(seasons))
+
+    fig, ax = plt.subplots()
+    bar_width = 0.35
+
+    bar1 = ax.bar(x - bar_width / 2, fish_born, bar_width, label='Fish Born')
+    bar2 = ax.bar(x + bar_width / 2, fish_caught, bar_width, label='Fish Caught')
+
+    ax.set_xlabel('Season')
+    ax.set_ylabel('Count')
+    ax.set_title('Fish Born and Caught per Season')
+    ax.set_xticks(x)
+    ax.set_xticklabels(seasons)
+    ax.legend()
+
+    for bar in bar1 + bar2:
+        height = bar.get_height()
+        ax.annotate('{}'.format(height), xy=(bar.get_x() + bar.get_width() / 2, height), xytext=(0, 3),
+                    textcoords="offset points", ha='center', va='bottom')
+
+    plt.savefig(os.path.join(lake.output_dir, 'fish_born_and_caught_per_season.png'))
+    plt.close()
+
+
+def plot_time_series(lake, series=None, max_points=2000):
+    # series defaults to the lake's data; pass load_time_series(...) to plot a saved run.
+    # Long series are reduced to about max_points per line, keeping every bin's peaks.
+    if series is None:
+        series = lake.time_series()
+    time_steps = np.asarray(series['time_step'])
+    if not len(time_steps):
+        return
+
+    fig, axs = plt.subplots(3, 1, figsize=(10, 15))
+
+    # Define season names and colors
+    season_names = ["Spring", "Summer", "Fall", "Winter"]
+    season_colors = ["#98FB98", "#FFD700", "#FFA500", "#ADD8E6"]
+
+    def plot_line(ax, name, label, color):
+        values = np.asarray(series[name])
+        shown = minmax_indices(values, max_points)
+        ax.plot(time_steps[shown], values[shown], label=label, color=color)
+
+    # Plot Fish Population Over Time
+    plot_line(axs[0], 'fish_population', 'Fish Population', 'b')
+    axs[0].set_xlabel('Time Step')
+    axs[0].set_ylabel('Fish Population')
+    axs[0].set_title('Fish Population Over Time')
+    axs[0].legend()
+    add_season_shading(axs[0], lake.season_length, season_colors, time_steps[0], time_steps[-1])
+
+    # Plot Food Amount Over Time
+    plot_line(axs[1], 'food_amount', 'Food Amount', 'g')
+    axs[1].set_xlabel('Time Step')
+    axs[1].set_ylabel('Food Amount')
+    axs[1].set_title('Food Amount Over Time')
+    axs[1].legend()
+    add_season_shading(axs[1], lake.season_length, season_colors, time_steps[0], time_steps[-1])
+
+    # Plot Oxygen Level Over Time
+    plot_line(axs[2], 'oxygen_level', 'Oxygen Level', 'r')
+    axs[2].set_xlabel('Time Step')
+    axs[2].set_ylabel('Oxygen Level')
+    axs[2].set_title('Oxygen Level Over Time')
+    axs[2].legend()
+    add_season_shading(axs[2], lake.season_length, season_colors, time_steps[0], time_steps[-1])
+
+    for ax in axs:
+        ax.grid(True)
+
+    plt.tight_layout()
+    plt.savefig(os.path.join(lake.output_dir, 'overtime_stats.png'))
+    plt.close(fig)
+
+
+def add_season_shading(ax, season_length, season_colors, first_step, last_step):
+    # One span per season that actually occurred (time step t is in season
+    # (t // season_length) % 4), drawn as one collection per season color
+    first_season = int(first_step) // season_length
+    last_season = int(last_step) // season_length
+    spans = [[] for _ in season_colors]
+    for k in range(first_season, last_season + 1):
+        start = max(k * season_length, first_step)
+        end = min((k + 1) * season_length, last_step)
+        if end > start:
+            spans[k % 4].append((start, end - start))
+    for color, color_spans in zip(season_colors, spans):
+        if color_spans:
+            ax.broken_barh(color_spans, (0, 1), transform=ax.get_xaxis_transform(), facecolors=color, alpha=0.3)
+
+    # Add custom legend for season names and colors
+    custom_legend = [Patch(facecolor=color, label=season_name) for season_name, color in
+                     zip(["Spring", "Summer", "Fall", "Winter"], season_colors)]
+    ax.legend(handles=custom_legend, loc='upper right', bbox_to_anchor=(1.25, 1))
+
+
@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fisherman import Fisherman
+from fleet import FishingFleet
+from headless import build_simulation, prepare_output_dir
+from spatial_grid import neighbor_pairs
+
+# Import Lake and Fish and build a small lake in a fresh interpreter, in seconds
+STARTUP_TARGET = 0.5
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from fish import Fish
+from lake import Lake
+imported = time.perf_counter()
+Lake(800, 600, [Fish(id=0, energy=100, position=(0, 0))], 500, [], 10, 50, output_dir=sys.argv[1])
+built = time.perf_counter()
+heavy = sorted(name for name in ('matplotlib', 'tkinter', 'pandas', 'numba') if name in sys.modules)
+print(json.dumps({'import': imported - start, 'construct': built - imported, 'heavy_modules': heavy}))
+'''
+
+COMPONENTS = ['update', 'fish_move', 'seek_food', 'seek_food_indexed', 'fisherman_fish', 'log_data']
+
+# Per-tick statistics of the fish trajectories compared by compare_flocking
+TRAJECTORY_STATISTICS = ['speed', 'polarization', 'neighbors', 'nearest_neighbor', 'target_distance']
+
+
+def build_lake(fish_count, plant_count, seed, engine, output_dir, **lake_options):
+    random.seed(seed)
+    prepare_output_dir(output_dir)
+    lake, _ = build_simulation(fish_count, plant_count, (200, 150, 400, 350), 0.05, 10, 50,
+                               output_dir=output_dir, seed=seed, engine=engine, **lake_options)
+    return lake
+
+
+def per_call(function, calls, time_budget):
+    # Mean seconds per call, stopping early once the time budget is used up
+    start = time.perf_counter()
+    done = 0
+    for _ in range(calls):
+        function()
+        done += 1
+        if time.perf_counter() - start > time_budget:
+            break
+    return (time.perf_counter() - start) / done
+
+
+def bench_case(fish_count, plant_count, ticks, time_budget, seed, engine, output_dir):
+    result = {'fish': fish_count, 'plants': plant_count, 'engine': engine}
+
+    # Whole ticks, with the per-phase breakdown from the lake's own timer
+    lake = build_lake(fish_count, plant_count, seed, engine, output_dir)
+    tick_time = per_call(lake.update, ticks, time_budget)
+    result['update'] = tick_time
+    result['ticks_per_second'] = 1 / tick_time
+    result['phases'] = {name: stats['mean'] / 1000 for name, stats in lake.timer.stats().items()}
+    lake.close()
+
+    # Single components on a fresh lake, scaled to the cost per tick
+    lake = build_lake(fish_count, plant_count, seed, engine, output_dir)
+    population = list(lake.fish_population)
+    sample = population[:min(len(population), 200)]
+    lake.fish_grid.rebuild(population)
+    closest = lake.plant_index.nearest_many([tuple(fish.position) for fish in sample])
+    plants = list(lake.plants)
+    scale = len(population) / max(len(sample), 1)
+
+    def move_sample():
+        for fish, slot in zip(sample, closest):
+            fish.move(lake.fish_grid.neighbors(fish.position), lake.plants, lake.plants[slot] if slot >= 0 else None)
+
+    def seek_food_sample():
+        for fish in sample:
+            fish.seek_food(plants)
+
+    def seek_food_indexed():
+        lake.plant_index.nearest_many([tuple(fish.position) for fish in population])
+
+    result['fish_move'] = per_call(move_sample, 3, time_budget) * scale
+    result['seek_food'] = per_call(seek_food_sample, 3, time_budget) * scale
+    result['seek_food_indexed'] = per_call(seek_food_indexed, 3, time_budget)
+
+    # A fisherman that always casts over the whole lake; catches are put back so the
+    # population stays the same size
+    fleet = FishingFleet([Fisherman(probability=1.0, fishing_area=(0, 0, lake.width, lake.height))])
+
+    def fish_once():
+        before = list(lake.fish_population)
+        fleet.fish(lake)
+        for fish in before:
+            if fish not in lake.fish_population:
+                lake.fish_population.add(fish)
+
+    result['fisherman_fish'] = per_call(fish_once, 50, time_budget)
+    result['log_data'] = per_call(lake.log_data, 1000, time_budget)
+    lake.close()
+    return result
+
+
+def trajectory_statistics(lake):
+    # Mean speed, polarization (length of the mean heading, 1 when all fish swim the same
+    # way), neighbors within 50, distance to the nearest of them and distance to the target
+    population = lake.fish_population
+    positions = np.array([tuple(fish.position) for fish in population], dtype=float).reshape(-1, 2)
+    velocities = np.array([tuple(fish.velocity) for fish in population], dtype=float).reshape(-1, 2)
+    targets = np.array([tuple(fish.target) for fish in population], dtype=float).reshape(-1, 2)
+    speeds = np.hypot(velocities[:, 0], velocities[:, 1])
+    moving = speeds > 0
+    i, _, d = neighbor_pairs(positions, 50)
+    nearest = np.full(len(positions), np.inf)
+    np.minimum.at(nearest, i, d)
+    has_neighbors = np.isfinite(nearest)
+    return {
+        'speed': float(speeds.mean()),
+        'polarization': float(np.hypot(*(velocities[moving] / speeds[moving, None]).mean(axis=0))) if moving.any() else 0.0,
+        'neighbors': len(i) / max(len(positions), 1),
+        'nearest_neighbor': float(nearest[has_neighbors].mean()) if has_neighbors.any() else 0.0,
+        'target_distance': float(np.hypot(*(targets - positions).T).mean()),
+    }
+
+
+def compare_flocking(fish_count, plant_count, fractions, ticks, seed, engine, output_dir):
+    # Run the same seeded lake with every flocking_fraction and compare the time per tick
+    # and the trajectory statistics (averaged over the ticks) with full updates. The lake
+    # gets plenty of food so no fish starve and the runs keep the same fish.
+    fractions = sorted(set(fractions) | {1.0}, reverse=True)
+    runs = []
+    for fraction in fractions:
+        lake = build_lake(fish_count, plant_count, seed, engine, output_dir, flocking_fraction=fraction)
+        lake.food_amount = 10 ** 12
+        statistics = []
+        seconds = 0.0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            lake.update()
+            seconds += time.perf_counter() - start
+            statistics.append(trajectory_statistics(lake))
+        run = {name: float(np.mean([tick[name] for tick in statistics])) for name in TRAJECTORY_STATISTICS}
+        run.update(fraction=fraction, seconds_per_tick=seconds / ticks,
+                   fish_movement=lake.timer.stats()['fish_movement']['mean'] / 1000,
+                   positions={fish.id: tuple(fish.position) for fish in lake.fish_population})
+        lake.close()
+        runs.append(run)
+
+    reference = runs[0]
+    for run in runs:
+        # How far the same fish ended up from where they are with full updates
+        shared = [fish_id for fish_id in run['positions'] if fish_id in reference['positions']]
+        offsets = np.array([np.subtract(run['positions'][fish_id], reference['positions'][fish_id]) for fish_id in shared])
+        run['divergence'] = float(np.hypot(*offsets.reshape(-1, 2).T).mean()) if shared else 0.0
+        run['relative'] = {name: run[name] / reference[name] - 1 if reference[name] else 0.0 for name in TRAJECTORY_STATISTICS}
+        run['speedup'] = reference['seconds_per_tick'] / run['seconds_per_tick']
+    for run in runs:
+        del run['positions']
+    return {'fish': fish_count, 'plants': plant_count, 'engine': engine, 'ticks': ticks, 'runs': runs}
+
+
+def smoke_run(ticks=50, seed=0):
+    # Every engine with no fish, one fish and a few fish, with full and staggered flocking;
+    # returns the cases that raised
+    failures = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for engine in ('objects', 'arrays', 'jit'):
+            for fish_count in (0, 1, 10):
+                for fraction in (1.0, 0.5):
+                    try:
+                        lake = build_lake(fish_count, 20, seed, engine, os.path.join(output_dir, 'analyze'),
+                                          flocking_fraction=fraction)
+                        for _ in range(ticks):
+                            lake.update()
+                        lake.close()
+                    except Exception as error:
+                        failures.append((engine, fish_count, fraction, repr(error)))
+    return failures
+
+
+def measure_startup(repeats=5):
+    # Median over fresh interpreters, so nothing is already imported or cached in memory
+    package = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, output_dir], cwd=package, check=True,
+                                    capture_output=True, text=True).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            run['process'] = time.perf_counter() - start
+            runs.append(run)
+    startup = {name: float(np.median([run[name] for run in runs])) for name in ('import', 'construct', 'process')}
+    startup['heavy_modules'] = runs[0]['heavy_modules']
+    startup['target'] = STARTUP_TARGET
+    startup['within_target'] = startup['import'] + startup['construct'] <= STARTUP_TARGET
+    return startup
+
+
+def scaling_exponents(cases):
+    # Slope of log(time) against log(fish count) for every component and plant count
+    exponents = {}
+    for component in COMPONENTS:
+        exponents[component] = {}
+        for plant_count in sorted({case['plants'] for case in cases}):
+            points = [(case['fish'], case[component]) for case in cases if case['plants'] == plant_count and case[component] > 0]
+            if len(points) >= 2:
+                fish, seconds = np.log(np.array(points)).T
+                exponents[component][str(plant_count)] = float(np.polyfit(fish, seconds, 1)[0])
+    return exponents
+
+
+def compare(results, baseline, tolerance):
+    # Components that got slower than the baseline by more than tolerance
+    baseline_cases = {(case['fish'], case['plants'], case['engine']): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        reference = baseline_cases.get((case['fish'], case['plants'], case['engine']))
+        if reference is None:
+            continue
+        for component in COMPONENTS:
+            ratio = case[component] / reference[component]
+            if ratio > 1 + tolerance:
+                regressions.append((case['fish'], case['plants'], component, ratio))
+    return regressions
+
+
+def run_benchmarks(fish_counts, plant_counts, ticks=20, time_budget=5.0, seed=0, engine='objects'):
+    with tempfile.TemporaryDirectory() as output_dir:
+        cases = [bench_case(fish_count, plant_count, ticks, time_budget, seed, engine, os.path.join(output_dir, 'analyze'))
+                 for plant_count in plant_counts for fish_count in fish_counts]
+    return {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                    'processor': platform.processor()},
+        'settings': {'ticks': ticks, 'time_budget': time_budget, 'seed': seed, 'engine': engine},
+        'cases': cases,
+        'scaling': scaling_exponents(cases),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Lake.update and its components across lake sizes.')
+    parser.add_argument('--fish', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--plants', type=int, nargs='+', default=[20, 200, 2000])
+    parser.add_argument('--ticks', type=int, default=20, help='ticks per case (fewer if the time budget runs out)')
+    parser.add_argument('--time-budget', type=float, default=5.0, help='seconds per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=['objects', 'arrays', 'jit'], default='objects')
+    parser.add_argument('--startup', action='store_true', help='only measure the import and construction time')
+    parser.add_argument('--smoke', action='store_true', help='only check that every engine runs with 0, 1 and 10 fish')
+    parser.add_argument('--flocking-fractions', type=float, nargs='+',
+                        help='only compare trajectory statistics and time per tick of these flocking fractions '
+                             'with full updates, for every fish and plant count')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='earlier benchmark JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before reporting a regression')
+    args = parser.parse_args(argv)
+
+    if args.smoke:
+        failures = smoke_run(seed=args.seed)
+        for engine, fish_count, fraction, error in failures:
+            print(f"{engine} engine, {fish_count} fish, flocking fraction {fraction}: {error}")
+        if failures:
+            raise SystemExit(1)
+        print('All engines ran')
+        return
+
+    if args.startup:
+        startup = measure_startup()
+        with open(args.output, 'w') as file:
+            json.dump({'startup': startup}, file, indent=2)
+        print(f"import {1000 * startup['import']:.0f} ms, construct {1000 * startup['construct']:.0f} ms, "
+              f"whole process {1000 * startup['process']:.0f} ms (target {1000 * STARTUP_TARGET:.0f} ms for import + construct)")
+        if startup['heavy_modules']:
+            print(f"Imported on startup: {', '.join(startup['heavy_modules'])}")
+        if not startup['within_target']:
+            raise SystemExit(1)
+        return
+
+    if args.flocking_fractions:
+        with tempfile.TemporaryDirectory() as output_dir:
+            comparisons = [compare_flocking(fish_count, plant_count, args.flocking_fractions, args.ticks, args.seed,
+                                            args.engine, os.path.join(output_dir, 'analyze'))
+                           for plant_count in args.plants for fish_count in args.fish]
+        with open(args.output, 'w') as file:
+            json.dump({'flocking': comparisons}, file, indent=2)
+        for comparison in comparisons:
+            print(f"{comparison['fish']} fish, {comparison['plants']} plants, {comparison['ticks']} ticks "
+                  f"({comparison['engine']}), change from full updates:")
+            print(f"{'fraction':>9} {'ms/tick':>9} {'speedup':>8} " +
+                  ' '.join(f'{name:>17}' for name in TRAJECTORY_STATISTICS) + f" {'divergence':>11}")
+            for run in comparison['runs']:
+                print(f"{run['fraction']:>9.3f} {1000 * run['seconds_per_tick']:>9.2f} {run['speedup']:>7.2f}x " +
+                      ' '.join(f"{100 * run['relative'][name]:>16.1f}%" for name in TRAJECTORY_STATISTICS) +
+                      f" {run['divergence']:>11.1f}")
+        return
+
+    results = run_benchmarks(args.fish, args.plants, args.ticks, args.time_budget, args.seed, args.engine)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'fish':>7} {'plants':>7} {'ticks/s':>10} " + ' '.join(f'{name:>17}' for name in COMPONENTS[1:]))
+    for case in results['cases']:
+        print(f"{case['fish']:>7} {case['plants']:>7} {case['ticks_per_second']:>10.1f} " +
+              ' '.join(f"{1000 * case[name]:>14.3f} ms" for name in COMPONENTS[1:]))
+    for component, exponents in results['scaling'].items():
+        print(f"{component}: " + ', '.join(f"{plants} plants ~ N^{exponent:.2f}" for plants, exponent in exponents.items()))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for fish, plants, component, ratio in regressions:
+            print(f"REGRESSION {component} at {fish} fish / {plants} plants: {ratio:.2f}x baseline")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import json
+import random
+import struct
+import zlib
+
+import numpy as np
+from pygame.math import Vector2
+
+from fish import Fish
+from fisherman import Fisherman
+from fleet import FishingFleet
+from lake import Lake
+from plant import PlantStore
+from population import FishPopulation
+from tiled_lake import TiledLake
+
+# File layout: MAGIC, uint32 format version, uint32 header length, JSON header, then the
+# zlib-compressed concatenation of the arrays listed in the header
+MAGIC = b'LAKECKPT'
+FORMAT_VERSION = 1
+
+LAKE_FIELDS = ['width', 'height', 'food_amount', 'oxygen_level', 'generation_count', 'reproduction_interval',
+               'season_length', 'current_season', 'fish_born_per_season', 'fish_caught_per_season', 'plant_probabilities',
+               'engine', 'log_flush_rows', 'log_flush_interval', 'fish_born_this_step', 'fish_caught_this_step']
+FLOCKING_GOALS = ['fish_separation_goal', 'fish_alignment_goal', 'fish_neighbor_center']
+
+
+def lake_state(lake, fleet):
+    # Split the full simulation state into JSON-friendly values and NumPy arrays
+    if isinstance(lake, TiledLake):
+        raise ValueError("A TiledLake keeps its fish in worker processes and cannot be checkpointed")
+    lake.sync_retarget_timers()
+    population = list(lake.fish_population)
+    header = {name: getattr(lake, name) for name in LAKE_FIELDS}
+    header['columnar_log'] = lake.series is not None
+    header['plot_interval'] = lake.plot_interval
+    header['school_size'] = lake.school_size
+    header['flocking_fraction'] = lake.flocking_fraction
+    header['next_fish_id'] = lake.fish_population.next_fish_id
+    header['fish_limits'] = [[fish.max_speed, fish.max_force] for fish in population[:1]]
+    header['numpy_rng'] = lake.rng.bit_generator.state
+    random_version, random_internal, random_gauss = random.getstate()
+    header['python_random'] = [random_version, random_gauss]
+    header['fleet'] = [{'probability': fisherman.probability, 'fishing_area': list(fisherman.fishing_area),
+                        'catches': fleet.catches[k], 'catches_per_season': fleet.catches_per_season[k]}
+                       for k, fisherman in enumerate(fleet.fishermen)]
+
+    arrays = {
+        'fish_id': np.array([fish.id for fish in population], dtype=np.int64),
+        'fish_energy': np.array([fish.energy for fish in population], dtype=np.int64),
+        'fish_count': np.array([fish.count for fish in population], dtype=np.int64),
+        'fish_timer': np.array([fish.change_target_time for fish in population], dtype=np.int64),
+        'fish_position': np.array([tuple(fish.position) for fish in population], dtype=np.float64).reshape(-1, 2),
+        'fish_velocity': np.array([tuple(fish.velocity) for fish in population], dtype=np.float64).reshape(-1, 2),
+        'fish_target': np.array([tuple(fish.target) for fish in population], dtype=np.float64).reshape(-1, 2),
+        'plant_position': lake.plants.active_positions.copy(),
+        'plant_food': lake.plants.food_amounts[:len(lake.plants)].copy(),
+        'caught_position': np.array([tuple(pos) for pos, _ in lake.caught_fish_positions], dtype=np.float64).reshape(-1, 2),
+        'caught_ticks': np.array([ticks for _, ticks in lake.caught_fish_positions], dtype=np.int64),
+        'python_random': np.array(random_internal, dtype=np.uint32),
+    }
+    if lake.flocking_fraction < 1:
+        # Fish.flocking_goals as NaN-filled (n, 2) arrays, as School.from_fish keeps them
+        arrays['fish_has_goals'] = np.array([fish.flocking_goals is not None for fish in population], dtype=bool)
+        for k, name in enumerate(FLOCKING_GOALS):
+            goals = np.full((len(population), 2), np.nan)
+            for slot, fish in enumerate(population):
+                if fish.flocking_goals is not None and fish.flocking_goals[k] is not None:
+                    goals[slot] = tuple(fish.flocking_goals[k])
+            arrays[name] = goals
+    for name, values in lake.time_series().items():
+        arrays[f'series_{name}'] = np.asarray(values)
+    return header, arrays
+
+
+def save_checkpoint(path, lake, fleet):
+    header, arrays = lake_state(lake, fleet)
+    blobs = []
+    header['arrays'] = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        header['arrays'].append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        blobs.append(array.tobytes())
+        offset += array.nbytes
+    header_bytes = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<II', FORMAT_VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        file.write(zlib.compress(b''.join(blobs), 6))
+
+
+def read_checkpoint(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a lake checkpoint")
+        version, header_length = struct.unpack('<II', file.read(8))
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version} (expected {FORMAT_VERSION})")
+        header = json.loads(file.read(header_length).decode('utf-8'))
+        data = zlib.decompress(file.read())
+    arrays = {}
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        arrays[entry['name']] = np.frombuffer(data, dtype=dtype, count=count, offset=entry['offset']).reshape(entry['shape'])
+    return header, arrays
+
+
+def load_checkpoint(path, output_dir='analyze'):
+    # Rebuild the lake and fleet; logging starts again in output_dir from the saved tick
+    header, arrays = read_checkpoint(path)
+
+    population = FishPopulation()
+    for k in range(len(arrays['fish_id'])):
+        fish = Fish(id=int(arrays['fish_id'][k]), energy=int(arrays['fish_energy'][k]), position=arrays['fish_position'][k].tolist())
+        fish.velocity.update(*arrays['fish_velocity'][k].tolist())
+        fish.target.update(*arrays['fish_target'][k].tolist())
+        fish.change_target_time = int(arrays['fish_timer'][k])
+        if 'fish_count' in arrays:
+            fish.count = int(arrays['fish_count'][k])
+        if header['fish_limits']:
+            fish.max_speed, fish.max_force = header['fish_limits'][0]
+        if 'fish_has_goals' in arrays and arrays['fish_has_goals'][k]:
+            fish.flocking_goals = tuple(None if np.isnan(arrays[name][k, 0]) else Vector2(*arrays[name][k].tolist())
+                                        for name in FLOCKING_GOALS)
+        population.add(fish)
+    population.next_fish_id = header['next_fish_id']
+
+    plants = PlantStore(capacity=len(arrays['plant_food']))
+    plants.add_many(arrays['plant_position'], arrays['plant_food'])
+
+    lake = Lake(header['width'], header['height'], population, header['food_amount'], plants,
+                header['reproduction_interval'], header['season_length'], engine=header['engine'],
+                log_flush_rows=header['log_flush_rows'], log_flush_interval=header['log_flush_interval'],
+                columnar_log=header['columnar_log'], output_dir=output_dir, plot_interval=header.get('plot_interval'),
+                school_size=header.get('school_size'), flocking_fraction=header.get('flocking_fraction', 1.0))
+    for name in LAKE_FIELDS:
+        setattr(lake, name, header[name])
+    lake.schedule_retargets()
+    lake.caught_fish_positions = [(tuple(position.tolist()), int(ticks))
+                                  for position, ticks in zip(arrays['caught_position'], arrays['caught_ticks'])]
+    if lake.series is not None:
+        for row in zip(*(arrays[f'series_{name}'] for name in lake.series.columns)):
+            lake.series.append(**dict(zip(lake.series.columns, row)))
+    else:
+        lake.time_steps = arrays['series_time_step'].tolist()
+        lake.fish_population_log = arrays['series_fish_population'].tolist()
+        lake.food_amount_log = arrays['series_food_amount'].tolist()
+        lake.oxygen_level_log = arrays['series_oxygen_level'].tolist()
+
+    fleet = FishingFleet()
+    for entry in header['fleet']:
+        fleet.add(Fisherman(probability=entry['probability'], fishing_area=tuple(entry['fishing_area'])))
+        fleet.catches[-1] = entry['catches']
+        fleet.catches_per_season[-1] = dict(entry['catches_per_season'])
+
+    # Random states last, since building the fish above draws from the random module
+    lake.rng.bit_generator.state = header['numpy_rng']
+    random_version, random_gauss = header['python_random']
+    random.setstate((random_version, tuple(int(value) for value in arrays['python_random']), random_gauss))
+    return lake, fleet
@@ -0,0 +1,167 @@
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from checkpoint import load_checkpoint
+from fisherman import Fisherman
+from fleet import FishingFleet
+from headless import DEFAULT_PARAMETERS, prepare_output_dir, run_headless
+
+SUMMARY_FIELDS = ['run', 'seed', 'final_population', 'extinction_tick', 'total_fish_born', 'total_fish_caught',
+                  'final_food_amount', 'final_oxygen_level', 'ticks_per_second']
+
+
+def expand_grid(grid, seeds):
+    # One run per combination of parameter values and seed, e.g.
+    # {'fisherman_probability': [0.01, 0.05], 'season_length': [50, 100]} x seeds
+    names = sorted(grid)
+    runs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        for seed in seeds:
+            runs.append({'run': len(runs), 'seed': seed, 'parameters': dict(zip(names, values))})
+    return runs
+
+
+@contextlib.contextmanager
+def run_log(run_dir):
+    # The fleet's catch messages of one run go to run_dir/run.log
+    handler = logging.FileHandler(os.path.join(run_dir, 'run.log'), mode='w')
+    logger = logging.getLogger('fleet')
+    level = logger.level
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        yield
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+        handler.close()
+
+
+def run_member(run, ticks, output_dir, plots=False):
+    run_dir = os.path.join(output_dir, f"run_{run['run']:04d}")
+    prepare_output_dir(run_dir)
+    with run_log(run_dir):
+        result = run_headless(ticks, seed=run['seed'], plots=plots, output_dir=run_dir, clear_output=False,
+                              **run['parameters'])
+
+    summary = {'run': run['run'], 'seed': run['seed']}
+    summary.update(summarize_run(result['lake'], result['ticks_per_second']))
+    summary.update(run['parameters'])
+    with open(os.path.join(run_dir, 'summary.json'), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+def summarize_run(lake, ticks_per_second):
+    series = lake.time_series()
+    extinction_tick = next((int(step) for step, count in zip(series['time_step'], series['fish_population']) if count == 0), None)
+    return {
+        'final_population': lake.fish_count,
+        'extinction_tick': extinction_tick,
+        'total_fish_born': sum(lake.fish_born_per_season.values()),
+        'total_fish_caught': sum(lake.fish_caught_per_season.values()),
+        'final_food_amount': lake.food_amount,
+        'final_oxygen_level': lake.oxygen_level,
+        'ticks_per_second': ticks_per_second,
+    }
+
+
+def run_ensemble(grid, seeds, ticks, output_dir='ensemble', processes=None, plots=False):
+    # Run every grid point and seed as an independent simulation across a process pool
+    runs = expand_grid(grid, seeds)
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        summaries = list(pool.map(run_member, runs, itertools.repeat(ticks), itertools.repeat(output_dir),
+                                  itertools.repeat(plots)))
+
+    with open(os.path.join(output_dir, 'ensemble_summary.csv'), mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS + sorted(grid))
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def run_fork(path, variant, ticks, output_dir):
+    # One what-if run from a checkpoint. A variant may replace the fleet with
+    # 'fishermen': [[probability, [x1, y1, x2, y2]], ...], set lake attributes through
+    # 'lake', and reseed both random generators with 'seed'.
+    run_dir = os.path.join(output_dir, f"fork_{variant['fork']:04d}")
+    prepare_output_dir(run_dir)
+    with run_log(run_dir):
+        lake, fleet = load_checkpoint(path, output_dir=run_dir)
+        if 'fishermen' in variant:
+            fleet = FishingFleet(Fisherman(probability=probability, fishing_area=tuple(area))
+                                 for probability, area in variant['fishermen'])
+        for name, value in variant.get('lake', {}).items():
+            setattr(lake, name, value)
+        if variant.get('seed') is not None:
+            random.seed(variant['seed'])
+            lake.rng = np.random.default_rng(variant['seed'])
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            lake.update()
+            fleet.fish(lake)
+        elapsed = time.perf_counter() - start
+        lake.close()
+        fleet.write_catches(os.path.join(run_dir, 'catches.csv'))
+
+    summary = {'fork': variant['fork'], 'variant': json.dumps({k: v for k, v in variant.items() if k != 'fork'})}
+    summary.update(summarize_run(lake, ticks / elapsed if elapsed > 0 else float('inf')))
+    return summary
+
+
+def fork_checkpoint(path, variants, ticks, output_dir='forks', processes=None):
+    # Continue one checkpoint under several variants in parallel
+    variants = [dict(variant, fork=k) for k, variant in enumerate(variants)]
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        summaries = list(pool.map(run_fork, itertools.repeat(path), variants, itertools.repeat(ticks),
+                                  itertools.repeat(output_dir)))
+    with open(os.path.join(output_dir, 'fork_summary.csv'), mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(summaries[0]))
+        writer.writeheader()
+        writer.writerows(summaries)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of headless lake simulations.')
+    parser.add_argument('grid', help='JSON file mapping parameter names to lists of values, '
+                                     'or with --checkpoint a list of fork variants')
+    parser.add_argument('--checkpoint', help='fork every variant from this checkpoint instead of starting fresh')
+    parser.add_argument('--seeds', type=int, default=5, help='number of seeds per grid point')
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default='ensemble')
+    parser.add_argument('--plots', action='store_true', help='also write the plots of every run')
+    args = parser.parse_args(argv)
+
+    with open(args.grid) as file:
+        grid = json.load(file)
+    if args.checkpoint:
+        summaries = fork_checkpoint(args.checkpoint, grid, args.ticks, args.output, args.processes)
+        print(f"{len(summaries)} forks; summary written to {os.path.join(args.output, 'fork_summary.csv')}")
+        return
+    unknown = set(grid) - set(DEFAULT_PARAMETERS) - {'width', 'height', 'engine', 'columnar_log', 'plot_interval', 'tiles',
+                                                    'school_size', 'flocking_fraction'}
+    if unknown:
+        parser.error(f"Unknown parameters: {', '.join(sorted(unknown))}")
+
+    summaries = run_ensemble(grid, range(args.seeds), args.ticks, args.output, args.processes, args.plots)
+    extinct = sum(summary['extinction_tick'] is not None for summary in summaries)
+    print(f"{len(summaries)} runs, {extinct} extinct; summary written to {os.path.join(args.output, 'ensemble_summary.csv')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,111 +2,125 @@ import random
 from pygame.math import Vector2
 
 class Fish:
-    def __init__(self, id, energy, position):
+    def __init__(self, id, energy, position, world_size=(800, 600)):
         self.id = id
         self.energy = energy
+        # Width and height of the lake the fish swims in; Lake sets it to its own size
+        self.world_size = world_size
+        # Number of fish this agent stands for; more than 1 only for the schools of Lake(school_size=...)
+        self.count = 1
         self.position = Vector2(position)
         self.velocity = Vector2(random.uniform(-1, 1), random.uniform(-1, 1)).normalize()
         self.max_speed = 2
         self.max_force = 0.1
         self.change_target_time = random.randint(30, 90)
         self.target = self.random_target()
+        # neighbor_goals from the last time the neighbors were looked at
+        self.flocking_goals = None
 
     def random_target(self):
-        return Vector2(random.randint(0, 800), random.randint(0, 600))
+        return Vector2(random.randint(0, self.world_size[0]), random.randint(0, self.world_size[1]))
 
-    def move(self, fish_population, food_sources):
+    def move(self, fish_population, food_sources, closest_food=None, countdown=True, flocking=True):
+        # Lake retargets its fish from a timer wheel and passes countdown=False; with
+        # flocking=False the neighbors are not looked at and the last flocking_goals are used
         if self.energy > 0:
             self.energy -= 1
-            self.change_target_time -= 1
-            if self.change_target_time <= 0:
-                self.target = self.random_target()
-                self.change_target_time = random.randint(30, 90)
-            acceleration = self.steer(fish_population, food_sources)
+            if countdown:
+                self.change_target_time -= 1
+                if self.change_target_time <= 0:
+                    self.target = self.random_target()
+                    self.change_target_time = random.randint(30, 90)
+            acceleration = self.steer(fish_population, food_sources, closest_food, flocking)
             self.velocity += acceleration
             if self.velocity.length() > self.max_speed:
                 self.velocity.scale_to_length(self.max_speed)
             self.position += self.velocity
-            self.position.x = max(0, min(self.position.x, 800))
-            self.position.y = max(0, min(self.position.y, 600))
+            self.position.x = max(0, min(self.position.x, self.world_size[0]))
+            self.position.y = max(0, min(self.position.y, self.world_size[1]))
         else:
             self.die()
 
-    def steer(self, fish_population, food_sources):
-        separation_force = self.separation(fish_population) * 1.5
-        alignment_force = self.alignment(fish_population) * 1.0
-        cohesion_force = self.cohesion(fish_population) * 1.0
-        seek_food_force = self.seek_food(food_sources) * 2.0
+    def steer(self, fish_population, food_sources, closest_food=None, flocking=True):
+        if flocking or self.flocking_goals is None:
+            self.flocking_goals = self.neighbor_goals(fish_population)
+        separation_velocity, alignment_velocity, neighbor_center = self.flocking_goals
+        separation_force = self.steer_towards(separation_velocity) * 1.5
+        alignment_force = self.steer_towards(alignment_velocity) * 1.0
+        cohesion_force = (self.seek(neighbor_center) if neighbor_center is not None else Vector2(0, 0)) * 1.0
+        seek_food_force = self.seek_food(food_sources, closest_food) * 2.0
         seek_target_force = self.seek(self.target) * 2.0
         return separation_force + alignment_force + cohesion_force + seek_food_force + seek_target_force
 
-    def separation(self, fish_population):
+    def neighbor_goals(self, fish_population):
+        # What the neighbors ask of this fish, before its own velocity is taken into
+        # account: the velocity away from those closer than 20, the velocity matching
+        # those closer than 50 and their center (None when there are none)
         desired_separation = 20
-        steer = Vector2(0, 0)
-        count = 0
-        for other in fish_population:
-            if other != self:
-                distance = self.position.distance_to(other.position)
-                if 0 < distance < desired_separation:
-                    diff = self.position - other.position
-                    if diff.length() > 0:
-                        diff = diff.normalize() / distance
-                    steer += diff
-                    count += 1
-        if count > 0:
-            steer /= count
-        if steer.length() > 0:
-            steer = steer.normalize() * self.max_speed - self.velocity
-            if steer.length() > self.max_force:
-                steer = steer.normalize() * self.max_force
-        return steer
-
-    def alignment(self, fish_population):
         neighbor_dist = 50
+        away = Vector2(0, 0)
+        close_count = 0
         avg_velocity = Vector2(0, 0)
+        avg_position = Vector2(0, 0)
         count = 0
         for other in fish_population:
             if other != self:
                 distance = self.position.distance_to(other.position)
                 if 0 < distance < neighbor_dist:
                     avg_velocity += other.velocity
+                    avg_position += other.position
                     count += 1
+                    if distance < desired_separation:
+                        away += (self.position - other.position).normalize() / distance
+                        close_count += 1
+
+        separation_velocity = alignment_velocity = neighbor_center = None
+        if close_count > 0:
+            away /= close_count
+        if away.length() > 0:
+            separation_velocity = away.normalize() * self.max_speed
         if count > 0:
             avg_velocity /= count
             if avg_velocity.length() > 0:
                 avg_velocity = avg_velocity.normalize() * self.max_speed
-            steer = avg_velocity - self.velocity
-            if steer.length() > self.max_force:
-                steer = steer.normalize() * self.max_force
-            return steer
-        return Vector2(0, 0)
+            alignment_velocity = avg_velocity
+            neighbor_center = avg_position / count
+        return separation_velocity, alignment_velocity, neighbor_center
+
+    def steer_towards(self, velocity):
+        if velocity is None:
+            return Vector2(0, 0)
+        steer = velocity - self.velocity
+        if steer.length() > self.max_force:
+            steer = steer.normalize() * self.max_force
+        return steer
+
+    def separation(self, fish_population):
+        return self.steer_towards(self.neighbor_goals(fish_population)[0])
+
+    def alignment(self, fish_population):
+        return self.steer_towards(self.neighbor_goals(fish_population)[1])
 
     def cohesion(self, fish_population):
-        neighbor_dist = 50
-        avg_position = Vector2(0, 0)
-        count = 0
-        for other in fish_population:
-            if other != self:
-                distance = self.position.distance_to(other.position)
-                if 0 < distance < neighbor_dist:
-                    avg_position += other.position
-                    count += 1
-        if count > 0:
-            avg_position /= count
-            return self.seek(avg_position)
-        return Vector2(0, 0)
+        neighbor_center = self.neighbor_goals(fish_population)[2]
+        return self.seek(neighbor_center) if neighbor_center is not None else Vector2(0, 0)
 
     def seek(self, target):
-        desired = (target - self.position).normalize() * self.max_speed
+        # A fish right on its target only brakes, as in School._seek and the jit kernel
+        desired = target - self.position
+        if desired.length() > 0:
+            desired = desired.normalize() * self.max_speed
         steer = desired - self.velocity
         if steer.length() > self.max_force:
             steer = steer.normalize() * self.max_force
         return steer
 
-    def seek_food(self, food_sources):
-        if not food_sources:
-            return Vector2(0, 0)
-        closest_food = min(food_sources, key=lambda food: self.position.distance_to(Vector2(food.position)))
+    def seek_food(self, food_sources, closest_food=None):
+        # closest_food can be supplied by a PlantIndex lookup to skip the linear scan
+        if closest_food is None:
+            if not food_sources:
+                return Vector2(0, 0)
+            closest_food = min(food_sources, key=lambda food: self.position.distance_to(food.position))
         return self.seek(Vector2(closest_food.position))
 
     def eat(self, food):
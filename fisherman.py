@@ -9,10 +9,12 @@ class Fisherman:
         if random.random() < self.probability:
             fish_in_area = [fish for fish in lake.fish_population if self.is_in_fishing_area(fish.position)]
             if fish_in_area:
-                caught_fish = random.choice(fish_in_area)
-                lake.fish_population.remove(caught_fish)
-                lake.caught_fish_positions.append((caught_fish.position, 30))
-                lake.record_fish_caught()
+                if lake.school_size is None:
+                    caught_fish = random.choice(fish_in_area)
+                else:
+                    # Every fish of a school is as likely to be caught as a lone fish
+                    caught_fish = random.choices(fish_in_area, weights=[fish.count for fish in fish_in_area])[0]
+                lake.catch_fish(caught_fish)
                 print(f"Fisherman caught fish: {caught_fish.id}")
 
     def is_in_fishing_area(self, position):
@@ -0,0 +1,82 @@
+import csv
+import logging
+import random
+
+import numpy as np
+
+from fisherman import Fisherman
+
+SEASON_NAMES = ["Spring", "Summer", "Fall", "Winter"]
+
+# Every catch is logged at debug level; catches and catches_per_season keep the counts
+logger = logging.getLogger(__name__)
+
+
+class FishingFleet:
+    # Many fishermen with their own probabilities and (possibly overlapping) fishing
+    # areas. All catch attempts of a tick are resolved together: one vectorized
+    # rectangle test over the fish positions, then the fishermen that cast pick their
+    # fish in random order so no fish is caught twice.
+    def __init__(self, fishermen=()):
+        self.fishermen = []
+        self.catches = []
+        self.catches_per_season = []
+        for fisherman in fishermen:
+            self.add(fisherman)
+
+    def __len__(self):
+        return len(self.fishermen)
+
+    def add(self, fisherman):
+        self.fishermen.append(fisherman)
+        self.catches.append(0)
+        self.catches_per_season.append({season: 0 for season in SEASON_NAMES})
+
+    def fish(self, lake):
+        casting = [k for k, fisherman in enumerate(self.fishermen) if random.random() < fisherman.probability]
+        if not casting or not len(lake.fish_population):
+            return
+
+        population = list(lake.fish_population)
+        positions = np.array([tuple(fish.position) for fish in population])
+        areas = np.array([self.fishermen[k].fishing_area for k in casting], dtype=float)
+        x, y = positions[:, 0], positions[:, 1]
+        in_area = ((areas[:, 0, None] <= x) & (x <= areas[:, 2, None]) &
+                   (areas[:, 1, None] <= y) & (y <= areas[:, 3, None]))
+
+        # Fish left in every agent: a school can be fished by several fishermen
+        if lake.school_size is None:
+            remaining = np.ones(len(population), dtype=np.int64)
+        else:
+            remaining = np.array([fish.count for fish in population], dtype=np.int64)
+        order = list(range(len(casting)))
+        random.shuffle(order)
+        season_name = SEASON_NAMES[lake.current_season]
+        for row in order:
+            candidates = np.flatnonzero(in_area[row] & (remaining > 0))
+            if not len(candidates):
+                continue
+            if lake.school_size is None:
+                choice = random.choice(candidates)
+            else:
+                choice = random.choices(candidates.tolist(), weights=remaining[candidates].tolist())[0]
+            remaining[choice] -= 1
+            caught_fish = population[choice]
+            k = casting[row]
+            lake.catch_fish(caught_fish)
+            self.catches[k] += 1
+            self.catches_per_season[k][season_name] += 1
+            logger.debug("Fisherman %d caught fish: %d", k, caught_fish.id)
+
+    def write_catches(self, path):
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['fisherman', 'probability', 'x1', 'y1', 'x2', 'y2', 'total'] + SEASON_NAMES)
+            for k, fisherman in enumerate(self.fishermen):
+                writer.writerow([k, fisherman.probability, *fisherman.fishing_area, self.catches[k]] +
+                                [self.catches_per_season[k][season] for season in SEASON_NAMES])
+
+
+def build_fleet(fishermen):
+    # fishermen: iterable of (probability, (x1, y1, x2, y2)) pairs
+    return FishingFleet(Fisherman(probability=probability, fishing_area=tuple(area)) for probability, area in fishermen)
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+
+from fish import Fish
+from checkpoint import save_checkpoint
+from fisherman import Fisherman
+from fleet import FishingFleet, build_fleet
+from lake import Lake
+from plant import Plant
+from tiled_lake import TiledLake
+
+# Same defaults as the configuration window in main.py
+DEFAULT_PARAMETERS = {
+    'initial_fish_count': 10,
+    'initial_plant_count': 20,
+    'fishing_area': (200, 150, 400, 350),
+    'fisherman_probability': 0.05,
+    'reproduction_interval': 10,
+    'season_length': 50,
+    'extra_fishermen': (),
+}
+
+
+def prepare_output_dir(path='analyze'):
+    # Start every run with an empty output folder
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+
+def build_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability, reproduction_interval,
+                     season_length, width=800, height=600, extra_fishermen=(), tiles=None, **lake_options):
+    # extra_fishermen: (probability, (x1, y1, x2, y2)) pairs fishing alongside the main fisherman.
+    # With tiles=(columns, rows) the fish are stepped by one worker process per tile, and
+    # with school_size they start in schools of up to school_size fish.
+    if tiles is not None:
+        lake_options['tiles'] = tuple(tiles)
+    school_size = lake_options.get('school_size') or 1
+    counts = [min(school_size, initial_fish_count - start) for start in range(0, initial_fish_count, school_size)]
+    fish = [Fish(id=i, energy=100, position=(random.randint(0, width), random.randint(0, height)), world_size=(width, height))
+            for i in range(len(counts))]
+    for school, count in zip(fish, counts):
+        school.count = count
+    lake = (Lake if tiles is None else TiledLake)(
+        width,
+        height,
+        fish,
+        500,
+        [Plant(position=(random.randint(0, width), random.randint(0, height))) for _ in range(initial_plant_count)],
+        reproduction_interval=reproduction_interval,
+        season_length=season_length,
+        **lake_options
+    )
+    fleet = FishingFleet([Fisherman(probability=fisherman_probability, fishing_area=tuple(fishing_area))])
+    for fisherman in build_fleet(extra_fishermen).fishermen:
+        fleet.add(fisherman)
+    return lake, fleet
+
+
+def run_headless(ticks, seed=None, plots=True, output_dir='analyze', checkpoint=None, fast_forward=0, metrics=None,
+                 clear_output=True, **parameters):
+    # Run the model without any window, as fast as possible, and return throughput figures.
+    # With fast_forward the first fast_forward steps use the mean-field model (meanfield.py)
+    # and the agents are sampled from its state for the remaining ticks. metrics is a
+    # started MetricsServer (metrics_server.py) that gets a sample after every tick. With
+    # clear_output=False output_dir must already exist and is used as it is.
+    if seed is not None:
+        random.seed(seed)
+    if clear_output:
+        prepare_output_dir(output_dir)
+    lake, fleet = build_simulation(output_dir=output_dir, seed=seed, **{**DEFAULT_PARAMETERS, **parameters})
+    if fast_forward:
+        from meanfield import MeanFieldLake
+        MeanFieldLake.from_lake(lake, fleet).advance(fast_forward).switch_to_agents(lake, seed)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        lake.update()
+        lake.timer.start()
+        fleet.fish(lake)
+        lake.timer.lap('fishing')
+        if metrics is not None:
+            metrics.publish(lake)
+    elapsed = time.perf_counter() - start
+
+    if checkpoint:
+        save_checkpoint(checkpoint, lake, fleet)
+    lake.close()
+    fleet.write_catches(os.path.join(output_dir, 'catches.csv'))
+    if plots:
+        lake.plot_stats()
+        lake.plot_time_series()
+
+    return {
+        'ticks': ticks,
+        'seconds': elapsed,
+        'ticks_per_second': ticks / elapsed if elapsed > 0 else float('inf'),
+        'stats': lake.get_stats(),
+        'lake': lake,
+        'fleet': fleet,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the lake simulation without rendering.')
+    parser.add_argument('--ticks', type=int, default=1000, help='number of time steps to simulate')
+    parser.add_argument('--config', help='JSON file with simulation parameters')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--output', default='analyze', help='output folder (default: analyze)')
+    parser.add_argument('--checkpoint', help='save a checkpoint of the final state to this file')
+    parser.add_argument('--fast-forward', type=int, default=0, metavar='TICKS',
+                        help='advance this many steps with the mean-field model before the agent ticks')
+    parser.add_argument('--metrics-port', type=int,
+                        help='stream live stats to http://127.0.0.1:PORT/stream (Server-Sent Events) during the run')
+    parser.add_argument('--metrics-every', type=int, default=1, help='send the stats of every Nth tick only')
+    parser.add_argument('--metrics-interval', type=float, default=0.1,
+                        help='send at most one sample per this many seconds (default: 0.1)')
+    parser.add_argument('--no-plots', action='store_true', help='skip writing the plots to the output folder')
+    parser.add_argument('--fish', type=int, dest='initial_fish_count')
+    parser.add_argument('--plants', type=int, dest='initial_plant_count')
+    parser.add_argument('--fishing-area', type=int, nargs=4, dest='fishing_area', metavar=('X1', 'Y1', 'X2', 'Y2'))
+    parser.add_argument('--fisherman-probability', type=float, dest='fisherman_probability')
+    parser.add_argument('--reproduction-interval', type=int, dest='reproduction_interval')
+    parser.add_argument('--season-length', type=int, dest='season_length')
+    parser.add_argument('--extra-fisherman', type=float, nargs=5, action='append', dest='extra_fishermen',
+                        metavar=('PROBABILITY', 'X1', 'Y1', 'X2', 'Y2'), help='add another fisherman (repeatable)')
+    parser.add_argument('--engine', choices=['objects', 'arrays', 'jit'])
+    parser.add_argument('--columnar-log', action='store_true', default=None, dest='columnar_log')
+    parser.add_argument('--world-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help='size of the lake (default: 800 600)')
+    parser.add_argument('--tiles', type=int, nargs=2, metavar=('COLUMNS', 'ROWS'),
+                        help='split the lake into tiles stepped by parallel worker processes')
+    parser.add_argument('--plot-interval', type=int, dest='plot_interval',
+                        help='also redraw the time-series plots every this many steps during the run')
+    parser.add_argument('--school-size', type=int, dest='school_size',
+                        help='simulate the fish as schools of up to this many fish per agent')
+    parser.add_argument('--flocking-fraction', type=float, dest='flocking_fraction',
+                        help='share of the fish that look at their neighbors each tick (default: 1, all of them)')
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.config:
+        with open(args.config) as file:
+            parameters.update(json.load(file))
+    for name in ('initial_fish_count', 'initial_plant_count', 'fishing_area', 'fisherman_probability',
+                 'reproduction_interval', 'season_length', 'engine', 'columnar_log', 'plot_interval', 'tiles',
+                 'school_size', 'flocking_fraction'):
+        value = getattr(args, name)
+        if value is not None:
+            parameters[name] = value
+    if args.world_size:
+        parameters['width'], parameters['height'] = args.world_size
+    if args.extra_fishermen:
+        parameters['extra_fishermen'] = [(values[0], values[1:]) for values in args.extra_fishermen]
+
+    metrics = None
+    if args.metrics_port is not None:
+        from metrics_server import MetricsServer
+        metrics = MetricsServer(port=args.metrics_port, every=args.metrics_every, min_interval=args.metrics_interval).start()
+        print(f"Streaming stats on http://127.0.0.1:{metrics.port}/stream")
+    try:
+        result = run_headless(args.ticks, seed=args.seed, plots=not args.no_plots, output_dir=args.output,
+                              checkpoint=args.checkpoint, fast_forward=args.fast_forward, metrics=metrics, **parameters)
+    finally:
+        if metrics is not None:
+            metrics.close()
+    stats = result['stats']
+    print(f"{result['ticks']} ticks in {result['seconds']:.2f}s ({result['ticks_per_second']:.1f} ticks/s) | "
+          f"Fish: {stats['Fish count']} | Food: {stats['Food amount']:.2f} | Oxygen: {stats['Oxygen level']:.2f} | "
+          f"Season: {stats['Season']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,39 @@
-import csv
+import math
+import os
 import random
+import time
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.patches import Patch
 
 from fish import Fish
-from plant import Plant
+from plant import PlantStore
+from plant_index import PlantIndex
+from population import FishPopulation
+from profiling import PhaseTimer
+from school import School
+from spatial_grid import SpatialGrid
+from telemetry import TelemetryWriter
+from timer_wheel import TimerWheel
+from timeseries import TimeSeriesStore
 
 
 class Lake:
-    def __init__(self, width, height, initial_fish, initial_food, plants, reproduction_interval, season_length):
+    def __init__(self, width, height, initial_fish, initial_food, plants, reproduction_interval, season_length, engine='objects',
+                 log_flush_rows=500, log_flush_interval=5.0, columnar_log=False, output_dir='analyze',
+                 seed=None, plot_interval=None, school_size=None, flocking_fraction=1.0):
         self.width = width
         self.height = height
-        self.fish_population = initial_fish
+        self.fish_population = initial_fish if isinstance(initial_fish, FishPopulation) else FishPopulation(initial_fish)
+        # Fish keep to the lake's bounds, whatever size it is
+        for fish in self.fish_population:
+            fish.world_size = self.world_size
         self.food_amount = initial_food
-        self.plants = plants
+        self.plants = plants if isinstance(plants, PlantStore) else PlantStore(plants)
+        self.plant_index = PlantIndex(self.plants)
+        # Per-lake generator for the vectorized plant lifecycle draws
+        self.rng = np.random.default_rng(seed)
         self.oxygen_level = 100
+        self.output_dir = output_dir
         self.generation_count = 0
         self.reproduction_interval = reproduction_interval
         self.season_length = season_length
@@ -32,8 +49,41 @@ class Lake:
         self.food_amount_log = []
         self.oxygen_level_log = []
 
+        # With columnar_log the series go to typed arrays saved under <output_dir>/time_series
+        # instead of the lists above
+        self.series = TimeSeriesStore(os.path.join(output_dir, 'time_series')) if columnar_log else None
+        self.fish_born_this_step = 0
+        self.fish_caught_this_step = 0
+
         self.caught_fish_positions = []  # Initialize caught_fish_positions
 
+        # Uniform grid with cells as wide as the fish neighbor radius
+        self.fish_grid = SpatialGrid(cell_size=50)
+
+        # 'objects' steps each Fish in turn, 'arrays' steps the whole school with NumPy and
+        # 'jit' runs Fish.move with feeding for every fish in one kernel (steering_kernel.py)
+        if engine not in ('objects', 'arrays', 'jit'):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+
+        # With school_size every agent is a school of fish.count fish (super-individual)
+        # sharing one position and energy; schools split when only part of them finds
+        # food and small schools merge back up to school_size fish
+        if school_size is not None and engine == 'jit':
+            raise ValueError("The 'jit' engine feeds one fish per agent and cannot run schools")
+        self.school_size = school_size
+
+        # Fish move at most max_speed per tick, so their neighborhoods change slowly: with
+        # flocking_fraction below 1 only that fraction of the fish look at their neighbors
+        # each tick, in rotation, and the rest steer by what their neighbors asked last time
+        if not 0 < flocking_fraction <= 1:
+            raise ValueError(f"flocking_fraction must be in (0, 1], got {flocking_fraction}")
+        self.flocking_fraction = flocking_fraction
+
+        # Fish pick a new random target when their timer on this wheel runs out
+        self.retarget_wheel = TimerWheel()
+        self.schedule_retargets()
+
         # Plant reproduction and death probabilities per season
         self.plant_probabilities = {
             "Spring": {"reproduce": 0.003, "die": 0.0001},
@@ -42,42 +92,215 @@ class Lake:
             "Winter": {"reproduce": 0.001, "die": 0.008},
         }
 
+        # With plot_interval the time-series plots are redrawn every plot_interval steps
+        # during the run instead of only at the end
+        self.plot_interval = plot_interval
+
+        # Rolling timings of each phase of update, see get_stats
+        self.timer = PhaseTimer()
+
         # Create log files
+        self.log_flush_rows = log_flush_rows
+        self.log_flush_interval = log_flush_interval
         self.create_log_files()
+    @property
+    def world_size(self):
+        return self.width, self.height
+
+    @property
+    def fish_count(self):
+        if self.school_size is None:
+            return len(self.fish_population)
+        return sum(fish.count for fish in self.fish_population)
+
     def create_log_files(self):
-        #Initialize CSV log files
-        self.fish_population_file = 'analyze/fish_population_log.csv'
-        self.food_amount_file = 'analyze/food_amount_log.csv'
-        self.oxygen_level_file = 'analyze/oxygen_level_log.csv'
+        # One wide CSV row per time step, written in batches
+        self.log_file = os.path.join(self.output_dir, 'simulation_log.csv')
+        self.telemetry = TelemetryWriter(
+            self.log_file,
+            ['time_step', 'fish_population', 'food_amount', 'oxygen_level'],
+            flush_rows=self.log_flush_rows,
+            flush_interval=self.log_flush_interval,
+        )
 
-        # Write headers to log files
-        with open(self.fish_population_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['time_step', 'fish_population'])
+    def log_data(self):
+        self.telemetry.write_row([self.generation_count, self.fish_count, self.food_amount, self.oxygen_level])
 
-        with open(self.food_amount_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['time_step', 'food_amount'])
+    def close(self):
+        # Flush any buffered log rows, save the columnar series and the phase timings
+        self.telemetry.close()
+        if self.series is not None:
+            self.series.save()
+        self.timer.write_profile(os.path.join(self.output_dir, 'profile.csv'))
 
-        with open(self.oxygen_level_file, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['time_step', 'oxygen_level'])
+    def update(self):
+        timer = self.timer
+        update_start = time.perf_counter()
+        season_name, reproduction_chance = self.update_environment()
+        self.retarget()
+        flocking_due = self.flocking_due()
+
+        if self.engine == 'jit':
+            # Movement, feeding and death in one compiled pass over the whole school. The
+            # kernel is imported here so numba is only loaded when this engine is used
+            from steering_kernel import move_and_feed
+            school = School.from_fish(self.fish_population, self.world_size, flocking_due is not None)
+            self.food_amount, dead = move_and_feed(school, self.plant_index, self.food_amount, False, flocking_due)
+            school.write_back(self.fish_population, flocking_due is not None)
+            timer.lap('fish_movement')
+            for slot in np.flatnonzero(dead):
+                self.fish_population.mark_dead(self.fish_population[slot])
+            self.fish_population.compact()
+            timer.lap('feeding_and_death')
+        else:
+            if self.engine == 'arrays':
+                school = School.from_fish(self.fish_population, self.world_size, flocking_due is not None)
+                school.move(self.plant_index, False, flocking_due)
+                school.write_back(self.fish_population, flocking_due is not None)
+            else:
+                self.fish_grid.rebuild(self.fish_population)
+                # Each fish looks for food from where it starts the tick, so one batch query covers them all
+                closest_food = self.plant_index.nearest_many([tuple(fish.position) for fish in self.fish_population])
+                closest_food = {id(fish): self.plants[slot]
+                                for fish, slot in zip(self.fish_population, closest_food) if slot >= 0}
+
+            # Movement and feeding alternate fish by fish, so movement time is summed per fish
+            movement_setup_time = timer.split()
+            movement_time = 0.0
+            hungry = None
+
+            for k, fish in enumerate(self.fish_population):
+                if self.engine == 'objects':
+                    move_start = time.perf_counter()
+                    flocking = flocking_due is None or flocking_due[k]
+                    fish.move(self.fish_grid.neighbors(fish.position) if flocking else (), self.plants,
+                              closest_food.get(id(fish)), False, flocking)
+                    self.fish_grid.update(fish)
+                    movement_time += time.perf_counter() - move_start
+                if self.food_amount > 0:
+                    fed = min(fish.count, math.ceil(self.food_amount))
+                    if fed < fish.count:
+                        # Only part of the school finds food; the rest splits off hungry
+                        hungry = (fish, self.split_school(fish, fish.count - fed))
+                    fish.eat(1)
+                    self.food_amount -= fed
+
+                if fish.energy <= 0:
+                    self.fish_population.mark_dead(fish)
+                    self.fish_grid.remove(fish)
+            self.fish_population.compact()
+            if hungry is not None and hungry[1].energy > 0:
+                # Food runs out once per tick, so at most one school splits. It goes right behind the
+                # fed part to keep its place in the feeding order, as lone fish would
+                parent, school = hungry
+                self.fish_population.insert(self.fish_population.index(parent) + 1, school)
+            loop_time = timer.split()
+            timer.record('fish_movement', movement_setup_time + movement_time)
+            timer.record('feeding_and_death', loop_time - movement_time)
 
-    def log_data(self):
-        #Append data to CSV log files
-        with open(self.fish_population_file, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self.generation_count, len(self.fish_population)])
+        if self.generation_count % self.reproduction_interval == 0 and self.food_amount > 10 and self.oxygen_level > 10:
+            new_fish = []
+            if self.fish_count >= 2:
+                for fish in self.fish_population:
+                    born = self.births(fish, reproduction_chance)
+                    if born:
+                        if len(self.fish_population) >= 2:
+                            parent1, parent2 = random.sample(self.fish_population, 2)
+                        else:
+                            parent1 = parent2 = fish
+                        new_position = (parent1.position + parent2.position) / 2
+                        newborn = Fish(id=self.fish_population.new_id(), energy=50, position=new_position,
+                                       world_size=self.world_size)
+                        newborn.count = born
+                        new_fish.append(newborn)
+                        self.schedule_retarget(newborn)
+            self.fish_population.extend(new_fish)
+            born = sum(fish.count for fish in new_fish)
+            self.fish_born_per_season[season_name] += born
+            self.fish_born_this_step += born
+        if self.school_size is not None:
+            self.merge_schools()
+        timer.lap('reproduction')
+
+        self.finish_update(update_start)
+
+    def schedule_retargets(self):
+        # (Re)build the retarget wheel from the fish's change_target_time, the ticks left
+        # until they retarget
+        self.retarget_wheel.clear()
+        for fish in self.fish_population:
+            self.schedule_retarget(fish)
 
-        with open(self.food_amount_file, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self.generation_count, self.food_amount])
+    def schedule_retarget(self, fish):
+        self.retarget_wheel.schedule(fish.id, self.generation_count + fish.change_target_time)
 
-        with open(self.oxygen_level_file, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([self.generation_count, self.oxygen_level])
+    def sync_retarget_timers(self):
+        # Store the ticks left on the wheel back in change_target_time, e.g. for a checkpoint
+        for fish in self.fish_population:
+            fish.change_target_time = self.retarget_wheel.due[fish.id] - self.generation_count
+
+    def retarget(self):
+        # Fish whose timer runs out this tick pick a new target and timer. They go in
+        # population order, as they would counting down in Fish.move, so the random
+        # stream is the same.
+        due = (self.fish_population.get(fish_id) for fish_id in self.retarget_wheel.pop(self.generation_count))
+        for fish in sorted((fish for fish in due if fish is not None and fish.energy > 0), key=self.fish_population.index):
+            fish.target = fish.random_target()
+            fish.change_target_time = random.randint(30, 90)
+            self.schedule_retarget(fish)
+
+    def flocking_due(self):
+        # Which fish look at their neighbors this tick (None: all of them). Fish take turns
+        # by id, every fish once per 1 / flocking_fraction ticks on average, and fish
+        # without flocking_goals always do.
+        if self.flocking_fraction >= 1:
+            return None
+        population = self.fish_population
+        ticks = np.fromiter((fish.id for fish in population), dtype=np.int64, count=len(population)) + self.generation_count
+        due = np.floor(ticks * self.flocking_fraction) != np.floor((ticks - 1) * self.flocking_fraction)
+        due |= np.fromiter((fish.flocking_goals is None for fish in population), dtype=bool, count=len(population))
+        return due
+
+    def births(self, fish, reproduction_chance):
+        # Every fish of a school breeds with reproduction_chance
+        if fish.count == 1:
+            return 1 if random.random() < reproduction_chance else 0
+        return int(self.rng.binomial(fish.count, reproduction_chance))
+
+    def split_school(self, fish, count):
+        # Move count fish of a school into a new school at the same place
+        school = Fish(id=self.fish_population.new_id(), energy=fish.energy, position=fish.position,
+                      world_size=self.world_size)
+        school.velocity.update(fish.velocity)
+        school.count = count
+        self.schedule_retarget(school)
+        fish.count -= count
+        return school
+
+    def merge_schools(self):
+        # Schools below school_size with the same energy in the same grid cell join up
+        # to school_size fish, the earlier school in population order taking in the later
+        open_schools = {}
+        merged = []
+        for fish in self.fish_population:
+            if fish.count >= self.school_size:
+                continue
+            key = (fish.energy, int(fish.position.x // 50), int(fish.position.y // 50))
+            school = open_schools.get(key)
+            if school is None or school.count + fish.count > self.school_size:
+                open_schools[key] = fish
+                continue
+            school.count += fish.count
+            merged.append(fish)
+        for fish in merged:
+            self.fish_population.remove(fish)
+
+    def update_environment(self):
+        # Season, oxygen and plant phases of update; returns the season name and the
+        # fish reproduction chance for this step
+        timer = self.timer
+        timer.start()
 
-    def update(self):
         self.generation_count += 1
         self.current_season = (self.generation_count // self.season_length) % 4
         season_names = ["Spring", "Summer", "Fall", "Winter"]
@@ -103,165 +326,115 @@ class Lake:
             food_generation = 0.5
             oxygen_generation = 0.05 if day_time else -0.1
 
-        self.oxygen_level -= len(self.fish_population) * 0.05  # Fish respiration
+        fish_count = self.fish_count
+        self.oxygen_level -= fish_count * 0.05  # Fish respiration
 
         decay_factor = 0.02
-        self.oxygen_level -= decay_factor * (len(self.fish_population) + len(self.plants))
+        self.oxygen_level -= decay_factor * (fish_count + len(self.plants))
+        timer.lap('environment')
 
-        # Handle plant reproduction and death
-        new_plants = []
-        for plant in self.plants:
-            if random.random() < self.plant_probabilities[season_name]["die"]:
-                self.plants.remove(plant)
-            else:
-                if random.random() < self.plant_probabilities[season_name]["reproduce"]:
-                    new_plants.append(Plant(position=(random.randint(0, self.width), random.randint(0, self.height))))
-
-        self.plants.extend(new_plants)
+        # Handle plant reproduction and death, one draw per plant for each
+        plant_count = len(self.plants)
+        dies = self.rng.random(plant_count) < self.plant_probabilities[season_name]["die"]
+        reproduces = ~dies & (self.rng.random(plant_count) < self.plant_probabilities[season_name]["reproduce"])
+        self.plants.remove_many(np.flatnonzero(dies))
+        self.plants.add_many(self.rng.integers(0, (self.width + 1, self.height + 1), size=(np.count_nonzero(reproduces), 2)))
 
-        for plant in self.plants:
-            plant.generate_food()
-            self.food_amount += food_generation
-            self.oxygen_level += oxygen_generation
+        self.plants.generate_food()
+        self.food_amount += food_generation * len(self.plants)
+        self.oxygen_level += oxygen_generation * len(self.plants)
 
         self.food_amount = max(self.food_amount, 0)
         self.oxygen_level = max(self.oxygen_level, 0)
+        timer.lap('plants')
+        return season_name, reproduction_chance
 
-        for fish in self.fish_population:
-            fish.move(self.fish_population, self.plants)
-            if self.food_amount > 0:
-                fish.eat(1)
-                self.food_amount -= 1
-
-            if fish.energy <= 0:
-                self.fish_population.remove(fish)
-
-        if self.generation_count % self.reproduction_interval == 0 and self.food_amount > 10 and self.oxygen_level > 10:
-            new_fish = []
-            if len(self.fish_population) >= 2:
-                for fish in self.fish_population:
-                    if random.random() < reproduction_chance:
-                        parent1, parent2 = random.sample(self.fish_population, 2)
-                        new_position = (parent1.position + parent2.position) / 2
-                        new_fish.append(
-                            Fish(id=len(self.fish_population) + len(new_fish), energy=50, position=new_position))
-            self.fish_population.extend(new_fish)
-            self.fish_born_per_season[season_name] += len(new_fish)
-
+    def finish_update(self, update_start):
+        # Bookkeeping at the end of update, after the fish have moved and reproduced
+        timer = self.timer
         self.caught_fish_positions = [(pos, ticks - 1) for pos, ticks in self.caught_fish_positions if ticks > 0]
 
-        self.time_steps.append(self.generation_count)
-        self.fish_population_log.append(len(self.fish_population))
-        self.food_amount_log.append(self.food_amount)
-        self.oxygen_level_log.append(self.oxygen_level)
+        self.record_time_series()
 
         self.ensure_oxygen_level()
+        timer.lap('oxygen')
 
         # Log data to CSV files
         self.log_data()
+        timer.lap('log_data')
+
+        if self.plot_interval and self.generation_count % self.plot_interval == 0:
+            self.plot_time_series()
+            timer.lap('plotting')
+        timer.record('update', time.perf_counter() - update_start)
+
+    def record_time_series(self):
+        if self.series is not None:
+            self.series.append(
+                time_step=self.generation_count,
+                fish_population=self.fish_count,
+                food_amount=self.food_amount,
+                oxygen_level=self.oxygen_level,
+                fish_born=self.fish_born_this_step,
+                fish_caught=self.fish_caught_this_step,
+            )
+        else:
+            self.time_steps.append(self.generation_count)
+            self.fish_population_log.append(self.fish_count)
+            self.food_amount_log.append(self.food_amount)
+            self.oxygen_level_log.append(self.oxygen_level)
+        self.fish_born_this_step = 0
+        self.fish_caught_this_step = 0
+
+    def time_series(self):
+        if self.series is not None:
+            return self.series.as_dict()
+        return {
+            'time_step': self.time_steps,
+            'fish_population': self.fish_population_log,
+            'food_amount': self.food_amount_log,
+            'oxygen_level': self.oxygen_level_log,
+        }
 
     def ensure_oxygen_level(self):
         if self.oxygen_level < 10:
             # Boost plant oxygen production
-            for plant in self.plants:
-                self.oxygen_level += 0.5
+            self.oxygen_level += 0.5 * len(self.plants)
             # Reduce fish oxygen consumption
-            for fish in self.fish_population:
-                self.oxygen_level += 0.01
+            self.oxygen_level += 0.01 * self.fish_count
+
+    def catch_fish(self, fish):
+        # A fisherman takes one fish; a school only loses one of its fish
+        if self.school_size is not None and fish.count > 1:
+            fish.count -= 1
+            position = fish.position.copy()
+        else:
+            self.fish_population.remove(fish)
+            position = fish.position
+        self.caught_fish_positions.append((position, 30))
+        self.record_fish_caught()
 
     def record_fish_caught(self):
         season_names = ["Spring", "Summer", "Fall", "Winter"]
         season_name = season_names[self.current_season]
         self.fish_caught_per_season[season_name] += 1
+        self.fish_caught_this_step += 1
 
     def get_stats(self):
         season_names = ["Spring", "Summer", "Fall", "Winter"]
         return {
-            'Fish count': len(self.fish_population),
+            'Fish count': self.fish_count,
             'Food amount': self.food_amount,
             'Oxygen level': self.oxygen_level,
-            'Season': season_names[self.current_season]
+            'Season': season_names[self.current_season],
+            'Timings': self.timer.stats(),
         }
 
     def plot_stats(self):
-        seasons = ["Spring", "Summer", "Fall", "Winter"]
-        fish_born = [self.fish_born_per_season[season] for season in seasons]
-        fish_caught = [self.fish_caught_per_season[season] for season in seasons]
-
-        x = np.arange(len(seasons))
-
-        fig, ax = plt.subplots()
-        bar_width = 0.35
-
-        bar1 = ax.bar(x - bar_width / 2, fish_born, bar_width, label='Fish Born')
-        bar2 = ax.bar(x + bar_width / 2, fish_caught, bar_width, label='Fish Caught')
-
-        ax.set_xlabel('Season')
-        ax.set_ylabel('Count')
-        ax.set_title('Fish Born and Caught per Season')
-        ax.set_xticks(x)
-        ax.set_xticklabels(seasons)
-        ax.legend()
-
-        for bar in bar1 + bar2:
-            height = bar.get_height()
-            ax.annotate('{}'.format(height), xy=(bar.get_x() + bar.get_width() / 2, height), xytext=(0, 3),
-                        textcoords="offset points", ha='center', va='bottom')
-
-        plt.savefig('analyze/fish_born_and_caught_per_season.png')
-        plt.close()
-
-    def plot_time_series(self):
-        fig, axs = plt.subplots(3, 1, figsize=(10, 15))
-
-        # Define season names and colors
-        season_names = ["Spring", "Summer", "Fall", "Winter"]
-        season_colors = ["#98FB98", "#FFD700", "#FFA500", "#ADD8E6"]
-
-        # Plot Fish Population Over Time
-        axs[0].plot(self.time_steps, self.fish_population_log, label='Fish Population', color='b')
-        axs[0].set_xlabel('Time Step')
-        axs[0].set_ylabel('Fish Population')
-        axs[0].set_title('Fish Population Over Time')
-        axs[0].legend()
-        self._add_season_shading(axs[0], season_colors)
-
-        # Plot Food Amount Over Time
-        axs[1].plot(self.time_steps, self.food_amount_log, label='Food Amount', color='g')
-        axs[1].set_xlabel('Time Step')
-        axs[1].set_ylabel('Food Amount')
-        axs[1].set_title('Food Amount Over Time')
-        axs[1].legend()
-        self._add_season_shading(axs[1], season_colors)
-
-        # Plot Oxygen Level Over Time
-        axs[2].plot(self.time_steps, self.oxygen_level_log, label='Oxygen Level', color='r')
-        axs[2].set_xlabel('Time Step')
-        axs[2].set_ylabel('Oxygen Level')
-        axs[2].set_title('Oxygen Level Over Time')
-        axs[2].legend()
-        self._add_season_shading(axs[2], season_colors)
-
-        for ax in axs:
-            ax.grid(True)
-
-        plt.tight_layout()
-        plt.savefig('analyze/overtime_stats.png')
-        plt.close()
-
-    def _add_season_shading(self, ax, season_colors):
-        season_length = self.season_length
-        total_time_steps = len(self.time_steps)
-        for i in range(total_time_steps // season_length + 1):
-            for season_index, color in enumerate(season_colors):
-                start = (i * 4 + season_index) * season_length
-                end = start + season_length
-                if start < total_time_steps:
-                    ax.axvspan(start, min(end, total_time_steps), color=color, alpha=0.3)
-
-        # Add custom legend for season names and colors
-        custom_legend = [Patch(facecolor=color, label=season_name) for season_name, color in
-                         zip(["Spring", "Summer", "Fall", "Winter"], season_colors)]
-        ax.legend(handles=custom_legend, loc='upper right', bbox_to_anchor=(1.25, 1))
-
+        # Plotting lives in analysis.py so matplotlib is only imported when a plot is made
+        from analysis import plot_stats
+        plot_stats(self)
 
+    def plot_time_series(self, series=None, max_points=2000):
+        from analysis import plot_time_series
+        plot_time_series(self, series, max_points)
@@ -1,19 +1,36 @@
+import multiprocessing
 import os
-import random
-import shutil
 import sys
 import tkinter as tk
 from tkinter import messagebox
 
 import pygame
 
-from fish import Fish
-from fisherman import Fisherman
-from lake import Lake
-from plant import Plant
+from checkpoint import save_checkpoint
+from headless import build_simulation, prepare_output_dir
+from renderer import Renderer
+from shared_snapshot import SnapshotBuffer, simulation_worker
+from timestep import MAX_SPEED, REAL_TIME, StepScheduler
 
 
-def start_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability, reproduction_interval, season_length):
+def format_timings(timings):
+    return ' | '.join(f"{name}: {t['mean']:.2f}/{t['p95']:.2f}/{t['max']:.2f}" for name, t in timings.items())
+
+
+def start_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability, reproduction_interval, season_length,
+                     show_timings=False, extra_fishermen=(), speed=1.0, mode=REAL_TIME, worker_process=False, world_size=None,
+                     metrics_port=None):
+    # world_size is the size of the lake (default: the window size); it is drawn scaled to fit the window.
+    # With metrics_port the stats are also streamed to http://127.0.0.1:metrics_port/stream
+    world_width, world_height = world_size or (800, 600)
+    if worker_process:
+        start_worker_simulation(
+            dict(initial_fish_count=initial_fish_count, initial_plant_count=initial_plant_count, fishing_area=fishing_area,
+                 fisherman_probability=fisherman_probability, reproduction_interval=reproduction_interval,
+                 season_length=season_length, extra_fishermen=extra_fishermen, width=world_width, height=world_height),
+            speed, mode, metrics_port)
+        return
+
     # Initialize pygame
     pygame.init()
 
@@ -23,127 +40,205 @@ def start_simulation(initial_fish_count, initial_plant_count, fishing_area, fish
     pygame.display.set_caption('Lake Ecosystem Simulation')
 
     # Clear the /analyze folder
-    if os.path.exists('analyze'):
-        shutil.rmtree('analyze')
-    os.makedirs('analyze')
-
-    # Initialize lake and fisherman
-    lake = Lake(
-        width,
-        height,
-        [Fish(id=i, energy=100, position=(random.randint(0, width), random.randint(0, height))) for i in range(initial_fish_count)],
-        500,
-        [Plant(position=(random.randint(0, width), random.randint(0, height))) for _ in range(initial_plant_count)],
-        reproduction_interval=reproduction_interval,
-        season_length=season_length  # Include season_length parameter
-    )
-    fisherman = Fisherman(probability=fisherman_probability, fishing_area=fishing_area)
+    prepare_output_dir()
+
+    # Initialize lake and fishermen
+    lake, fleet = build_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability,
+                                   reproduction_interval, season_length, world_width, world_height, extra_fishermen)
 
     # Initialize clock and font
     clock = pygame.time.Clock()
     font = pygame.font.SysFont(None, 24)
-
-    # Main loop
+    timings_font = pygame.font.SysFont(None, 18)
+    renderer = Renderer(screen, [fisherman.fishing_area for fisherman in fleet.fishermen], font, timings_font,
+                        min(width / world_width, height / world_height))
+    metrics = None
+    if metrics_port is not None:
+        from metrics_server import MetricsServer
+        metrics = MetricsServer(port=metrics_port).start()
+
+    def step():
+        lake.update()
+        lake.timer.start()
+        fleet.fish(lake)
+        lake.timer.lap('fishing')
+        if metrics is not None:
+            metrics.publish(lake)
+
+    # 60 simulation steps per second times the speed multiplier, decoupled from drawing
+    scheduler = StepScheduler(ticks_per_second=60, speed=speed, mode=mode)
+    frame_seconds = 0.0
+
+    # Main loop. Keys: T timing overlay (mean/p95/max in ms), SPACE pause, N single step
+    # while paused, M max speed, +/- simulation speed, K save a checkpoint
     while True:
         for event in pygame.event.get():
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_t:
+                    show_timings = not show_timings
+                elif event.key == pygame.K_SPACE:
+                    scheduler.toggle_pause()
+                elif event.key == pygame.K_n:
+                    scheduler.step_once()
+                elif event.key == pygame.K_m:
+                    scheduler.toggle_max_speed()
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    scheduler.faster()
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    scheduler.slower()
+                elif event.key == pygame.K_k:
+                    save_checkpoint(os.path.join(lake.output_dir, f'checkpoint_{lake.generation_count}.lake'), lake, fleet)
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.full_redraw = True
             if event.type == pygame.QUIT:
                 pygame.quit()
+                if metrics is not None:
+                    metrics.close()
+                lake.close()
                 lake.plot_stats()
                 lake.plot_time_series()
                 sys.exit()
 
-        lake.update()
-        fisherman.fish(lake)
-
-        screen.fill((0, 0, 255))
-        pygame.draw.rect(screen, (0, 0, 0), fishing_area, 2)
-        for fish in lake.fish_population:
-            pygame.draw.circle(screen, (255, 255, 255), (int(fish.position[0]), int(fish.position[1])), 5)
-        for plant in lake.plants:
-            pygame.draw.circle(screen, (0, 255, 0), plant.position, 10)
-        for pos, _ in lake.caught_fish_positions:
-            pygame.draw.circle(screen, (255, 0, 0), (int(pos[0]), int(pos[1])), 5)
+        scheduler.run_frame(step, frame_seconds)
 
+        lake.timer.start()
         stats = lake.get_stats()
-        stats_surface = font.render(
-            f"Fish: {stats['Fish count']} | Food: {stats['Food amount']:.2f} | Oxygen: {stats['Oxygen level']:.2f} | Season: {stats['Season']}",
-            True, (255, 255, 255)
+        renderer.draw(
+            [fish.position for fish in lake.fish_population],
+            lake.plants.active_positions,
+            [pos for pos, _ in lake.caught_fish_positions],
+            f"Fish: {stats['Fish count']} | Food: {stats['Food amount']:.2f} | Oxygen: {stats['Oxygen level']:.2f} | "
+            f"Season: {stats['Season']} | Tick: {lake.generation_count} | {scheduler.describe()}",
+            format_timings(stats['Timings']) if show_timings else None,
         )
-        screen.blit(stats_surface, (10, 10))
+        lake.timer.lap('rendering')
+        # In max speed the frame budget already paces the loop
+        frame_seconds = clock.tick(0 if scheduler.mode == MAX_SPEED else 60) / 1000
+
+def start_worker_simulation(parameters, speed=1.0, mode=REAL_TIME, metrics_port=None):
+    # The lake runs in a separate process and publishes a snapshot of every step to
+    # shared memory; this process only handles the window and draws the latest snapshot
+    prepare_output_dir()
+    buffer = SnapshotBuffer()
+    commands = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=simulation_worker,
+                                     args=(parameters, buffer.name, buffer.capacities, commands, speed, mode, metrics_port))
+    worker.start()
+
+    pygame.init()
+    width, height = 800, 600
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_caption('Lake Ecosystem Simulation')
+    clock = pygame.time.Clock()
+    font = pygame.font.SysFont(None, 24)
+    fishing_areas = [parameters['fishing_area']] + [area for _, area in parameters['extra_fishermen']]
+    renderer = Renderer(screen, fishing_areas, font,
+                        scale=min(width / parameters.get('width', width), height / parameters.get('height', height)))
+    keys = {pygame.K_SPACE: 'pause', pygame.K_n: 'step', pygame.K_m: 'max_speed', pygame.K_PLUS: 'faster',
+            pygame.K_EQUALS: 'faster', pygame.K_KP_PLUS: 'faster', pygame.K_MINUS: 'slower', pygame.K_KP_MINUS: 'slower'}
+
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.KEYDOWN and event.key in keys:
+                commands.put((keys[event.key],))
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.full_redraw = True
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                commands.put(('stop',))
+                worker.join()
+                buffer.close()
+                buffer.unlink()
+                sys.exit()
 
-        pygame.display.flip()
+        snapshot = buffer.read()
+        if snapshot is not None:
+            stats = snapshot['stats']
+            renderer.draw(
+                snapshot['fish'],
+                snapshot['plants'],
+                snapshot['caught'],
+                f"Fish: {stats['Fish count']} | Food: {stats['Food amount']:.2f} | Oxygen: {stats['Oxygen level']:.2f} | "
+                f"Season: {stats['Season']} | Tick: {snapshot['generation']} | worker process",
+            )
         clock.tick(60)
 
-def on_confirm():
-    try:
-        initial_fish_count = int(fish_count_entry.get())
-        initial_plant_count = int(plant_count_entry.get())
-        fishing_area_x = int(fishing_area_x_entry.get())
-        fishing_area_y = int(fishing_area_y_entry.get())
-        fishing_area_width = int(fishing_area_width_entry.get())
-        fishing_area_height = int(fishing_area_height_entry.get())
-        fisherman_probability = float(fishing_probability_entry.get())
-        reproduction_interval = int(reproduction_interval_entry.get())
-        season_length = int(season_length_entry.get())
-
-        fishing_area = (fishing_area_x, fishing_area_y, fishing_area_width, fishing_area_height)
-
-        root.destroy()
-        start_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability, reproduction_interval, season_length)
-
-    except ValueError as e:
-        messagebox.showerror("Input Error", f"Invalid input: {e}")
-
-# GUI
-root = tk.Tk()
-root.title("Lake Simulation Configuration")
-
-tk.Label(root, text="Initial Fish Count:").grid(row=0, column=0)
-fish_count_entry = tk.Entry(root)
-fish_count_entry.insert(0, "10")
-fish_count_entry.grid(row=0, column=1)
-
-tk.Label(root, text="Initial Plant Count:").grid(row=1, column=0)
-plant_count_entry = tk.Entry(root)
-plant_count_entry.insert(0, "20")
-plant_count_entry.grid(row=1, column=1)
-
-tk.Label(root, text="Fishing Area Top-Left X Coordinate:").grid(row=2, column=0)
-fishing_area_x_entry = tk.Entry(root)
-fishing_area_x_entry.insert(0, "200")
-fishing_area_x_entry.grid(row=2, column=1)
-
-tk.Label(root, text="Fishing Area Top-Left Y Coordinate:").grid(row=3, column=0)
-fishing_area_y_entry = tk.Entry(root)
-fishing_area_y_entry.insert(0, "150")
-fishing_area_y_entry.grid(row=3, column=1)
-
-tk.Label(root, text="Fishing Area Width:").grid(row=4, column=0)
-fishing_area_width_entry = tk.Entry(root)
-fishing_area_width_entry.insert(0, "400")
-fishing_area_width_entry.grid(row=4, column=1)
-
-tk.Label(root, text="Fishing Area Height:").grid(row=5, column=0)
-fishing_area_height_entry = tk.Entry(root)
-fishing_area_height_entry.insert(0, "350")
-fishing_area_height_entry.grid(row=5, column=1)
-
-tk.Label(root, text="Fisherman's Probability of Catching a Fish:").grid(row=6, column=0)
-fishing_probability_entry = tk.Entry(root)
-fishing_probability_entry.insert(0, "0.05")
-fishing_probability_entry.grid(row=6, column=1)
-
-tk.Label(root, text="Fish Reproduction Interval:").grid(row=7, column=0)
-reproduction_interval_entry = tk.Entry(root)
-reproduction_interval_entry.insert(0, "10")
-reproduction_interval_entry.grid(row=7, column=1)
-
-tk.Label(root, text="Season Length:").grid(row=8, column=0)
-season_length_entry = tk.Entry(root)
-season_length_entry.insert(0, "50")
-season_length_entry.grid(row=8, column=1)
-
-confirm_button = tk.Button(root, text="Confirm", command=on_confirm)
-confirm_button.grid(row=9, columnspan=2)
-
-root.mainloop()
\ No newline at end of file
+def main():
+    # Configuration window; confirming it starts the simulation
+    def on_confirm():
+        try:
+            initial_fish_count = int(fish_count_entry.get())
+            initial_plant_count = int(plant_count_entry.get())
+            fishing_area_x = int(fishing_area_x_entry.get())
+            fishing_area_y = int(fishing_area_y_entry.get())
+            fishing_area_width = int(fishing_area_width_entry.get())
+            fishing_area_height = int(fishing_area_height_entry.get())
+            fisherman_probability = float(fishing_probability_entry.get())
+            reproduction_interval = int(reproduction_interval_entry.get())
+            season_length = int(season_length_entry.get())
+
+            fishing_area = (fishing_area_x, fishing_area_y, fishing_area_width, fishing_area_height)
+
+            root.destroy()
+            start_simulation(initial_fish_count, initial_plant_count, fishing_area, fisherman_probability, reproduction_interval, season_length)
+
+        except ValueError as e:
+            messagebox.showerror("Input Error", f"Invalid input: {e}")
+
+    # GUI
+    root = tk.Tk()
+    root.title("Lake Simulation Configuration")
+
+    tk.Label(root, text="Initial Fish Count:").grid(row=0, column=0)
+    fish_count_entry = tk.Entry(root)
+    fish_count_entry.insert(0, "10")
+    fish_count_entry.grid(row=0, column=1)
+
+    tk.Label(root, text="Initial Plant Count:").grid(row=1, column=0)
+    plant_count_entry = tk.Entry(root)
+    plant_count_entry.insert(0, "20")
+    plant_count_entry.grid(row=1, column=1)
+
+    tk.Label(root, text="Fishing Area Top-Left X Coordinate:").grid(row=2, column=0)
+    fishing_area_x_entry = tk.Entry(root)
+    fishing_area_x_entry.insert(0, "200")
+    fishing_area_x_entry.grid(row=2, column=1)
+
+    tk.Label(root, text="Fishing Area Top-Left Y Coordinate:").grid(row=3, column=0)
+    fishing_area_y_entry = tk.Entry(root)
+    fishing_area_y_entry.insert(0, "150")
+    fishing_area_y_entry.grid(row=3, column=1)
+
+    tk.Label(root, text="Fishing Area Width:").grid(row=4, column=0)
+    fishing_area_width_entry = tk.Entry(root)
+    fishing_area_width_entry.insert(0, "400")
+    fishing_area_width_entry.grid(row=4, column=1)
+
+    tk.Label(root, text="Fishing Area Height:").grid(row=5, column=0)
+    fishing_area_height_entry = tk.Entry(root)
+    fishing_area_height_entry.insert(0, "350")
+    fishing_area_height_entry.grid(row=5, column=1)
+
+    tk.Label(root, text="Fisherman's Probability of Catching a Fish:").grid(row=6, column=0)
+    fishing_probability_entry = tk.Entry(root)
+    fishing_probability_entry.insert(0, "0.05")
+    fishing_probability_entry.grid(row=6, column=1)
+
+    tk.Label(root, text="Fish Reproduction Interval:").grid(row=7, column=0)
+    reproduction_interval_entry = tk.Entry(root)
+    reproduction_interval_entry.insert(0, "10")
+    reproduction_interval_entry.grid(row=7, column=1)
+
+    tk.Label(root, text="Season Length:").grid(row=8, column=0)
+    season_length_entry = tk.Entry(root)
+    season_length_entry.insert(0, "50")
+    season_length_entry.grid(row=8, column=1)
+
+    confirm_button = tk.Button(root, text="Confirm", command=on_confirm)
+    confirm_button.grid(row=9, columnspan=2)
+
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+import argparse
+import json
+import math
+import os
+import random
+
+import numpy as np
+
+from fish import Fish
+from population import FishPopulation
+from tiled_lake import TiledLake
+
+SEASON_NAMES = ["Spring", "Summer", "Fall", "Winter"]
+
+# Per season: fish reproduction chance, food and daytime oxygen generation per plant,
+# as in Lake.update_environment (at night every season makes -0.1 oxygen per plant)
+SEASON_RATES = [(0.04, 1, 0.2), (0.05, 1.2, 0.3), (0.03, 0.8, 0.1), (0.02, 0.5, 0.05)]
+NIGHT_OXYGEN = -0.1
+
+NEWBORN_ENERGY = 50
+
+# Series compared by calibrate
+DRIFT_FIELDS = ['fish_population', 'food_amount', 'oxygen_level']
+
+
+class MeanFieldLake:
+    # Aggregate version of a Lake: instead of agents it keeps the expected number of fish
+    # at every energy level, the expected plant count and the food and oxygen balance, and
+    # advances them with the expected value of every rule of Lake.update and FishingFleet.fish:
+    #  - a fish loses one energy per tick unless it gets a unit of food, and the food that
+    #    is there is shared evenly over the energy levels (Lake feeds fish in population order),
+    #  - plants die and reproduce with their seasonal probabilities,
+    #  - fish are spread evenly over the lake, so a fisherman finds a fish in his area with
+    #    probability 1 - (1 - area share) ** fish count.
+    # It has no positions, so a tick costs the same for ten fish or ten million.
+    def __init__(self, width, height, energy_counts, plant_count, food_amount, oxygen_level, reproduction_interval,
+                 season_length, generation_count=0, fishermen=(), plant_probabilities=None):
+        self.width = width
+        self.height = height
+        # energy_counts[e] is the expected number of fish with energy e; it has room for
+        # newborns and one unit above the most energetic fish, the most a fish can have
+        size = max(len(energy_counts), NEWBORN_ENERGY) + 2
+        self.energy_counts = np.zeros(size)
+        self.energy_counts[:len(energy_counts)] = energy_counts
+        self.plant_count = float(plant_count)
+        self.food_amount = food_amount
+        self.oxygen_level = oxygen_level
+        self.reproduction_interval = reproduction_interval
+        self.season_length = season_length
+        self.generation_count = generation_count
+        self.current_season = (generation_count // season_length) % 4
+        self.plant_probabilities = plant_probabilities or {
+            "Spring": {"reproduce": 0.003, "die": 0.0001},
+            "Summer": {"reproduce": 0.005, "die": 0.002},
+            "Fall": {"reproduce": 0.002, "die": 0.0005},
+            "Winter": {"reproduce": 0.001, "die": 0.008},
+        }
+        # (probability, share of the lake inside the fishing area) per fisherman
+        self.fishermen = [(probability, self.area_share(area)) for probability, area in fishermen]
+
+        self.fish_born_per_season = {season: 0.0 for season in SEASON_NAMES}
+        self.fish_caught_per_season = {season: 0.0 for season in SEASON_NAMES}
+        self.fish_born_this_step = 0.0
+        self.fish_caught_this_step = 0.0
+        self.series = {name: [] for name in ['time_step', 'fish_population', 'food_amount', 'oxygen_level',
+                                             'fish_born', 'fish_caught']}
+
+    @classmethod
+    def from_lake(cls, lake, fleet=None):
+        # Aggregate the current state of a Lake (and its fishermen)
+        if isinstance(lake, TiledLake):
+            raise ValueError("A TiledLake keeps its fish energies in worker processes")
+        energies = np.array([fish.energy for fish in lake.fish_population], dtype=np.int64)
+        counts = np.array([fish.count for fish in lake.fish_population], dtype=float)
+        fishermen = [] if fleet is None else [(fisherman.probability, fisherman.fishing_area)
+                                              for fisherman in fleet.fishermen]
+        model = cls(lake.width, lake.height, np.bincount(np.maximum(energies, 0), weights=counts), len(lake.plants),
+                    lake.food_amount, lake.oxygen_level, lake.reproduction_interval, lake.season_length, lake.generation_count,
+                    fishermen, lake.plant_probabilities)
+        model.fish_born_per_season = dict(lake.fish_born_per_season)
+        model.fish_caught_per_season = dict(lake.fish_caught_per_season)
+        return model
+
+    @property
+    def fish_count(self):
+        return float(self.energy_counts.sum())
+
+    def area_share(self, area):
+        x1, y1, x2, y2 = area
+        width = max(min(x2, self.width) - max(x1, 0), 0)
+        height = max(min(y2, self.height) - max(y1, 0), 0)
+        return width * height / (self.width * self.height) if self.width and self.height else 0.0
+
+    def advance(self, ticks):
+        # Whole seasons at a time: the rates of a season are looked up once, and the
+        # plant count follows its closed form within the season
+        while ticks > 0:
+            first = self.generation_count + 1
+            season_end = (first // self.season_length + 1) * self.season_length - 1
+            count = min(ticks, season_end - self.generation_count)
+            self.advance_within_season(count)
+            ticks -= count
+        return self
+
+    def advance_season(self):
+        # Advance to the last tick of the current season
+        first = self.generation_count + 1
+        return self.advance((first // self.season_length + 1) * self.season_length - 1 - self.generation_count)
+
+    def advance_within_season(self, ticks):
+        first = self.generation_count + 1
+        season = (first // self.season_length) % 4
+        season_name = SEASON_NAMES[season]
+        reproduction_chance, food_generation, day_oxygen = SEASON_RATES[season]
+        die = self.plant_probabilities[season_name]["die"]
+        reproduce = self.plant_probabilities[season_name]["reproduce"]
+
+        # Expected survivors plus the offspring of the survivors, every tick
+        steps = np.arange(1, ticks + 1)
+        plant_counts = self.plant_count * ((1 - die) * (1 + reproduce)) ** steps
+        day_time = ((first + steps - 1) % self.season_length) < (self.season_length // 2)
+        oxygen_generation = np.where(day_time, day_oxygen, NIGHT_OXYGEN)
+
+        counts = self.energy_counts
+        for k in range(ticks):
+            self.generation_count += 1
+            self.current_season = season
+            fish_count = counts.sum()
+
+            # Respiration and decay use the counts from before the plants change
+            self.oxygen_level -= fish_count * 0.05
+            self.oxygen_level -= 0.02 * (fish_count + self.plant_count)
+            self.plant_count = plant_counts[k]
+            self.food_amount += food_generation * self.plant_count
+            self.oxygen_level += oxygen_generation[k] * self.plant_count
+            self.food_amount = max(self.food_amount, 0)
+            self.oxygen_level = max(self.oxygen_level, 0)
+
+            # Fed fish keep their energy, the others lose one and die at zero
+            eaten = min(fish_count, math.ceil(self.food_amount)) if self.food_amount > 0 else 0
+            self.food_amount -= eaten
+            fed = eaten / fish_count if fish_count > 0 else 0.0
+            counts[:-1] = fed * counts[:-1] + (1 - fed) * counts[1:]
+            counts[-1] *= fed
+            counts[0] = 0
+            fish_count = counts.sum()
+
+            if (self.generation_count % self.reproduction_interval == 0 and self.food_amount > 10 and
+                    self.oxygen_level > 10 and fish_count >= 2):
+                born = fish_count * reproduction_chance
+                counts[NEWBORN_ENERGY] += born
+                fish_count += born
+                self.fish_born_per_season[season_name] += born
+                self.fish_born_this_step += born
+
+            self.record_time_series(fish_count)
+            if self.oxygen_level < 10:
+                self.oxygen_level += 0.5 * self.plant_count
+                self.oxygen_level += 0.01 * fish_count
+
+            # The fishermen go out after the update, as in the headless runner; every
+            # catch takes away a fish of any energy
+            if self.fishermen and fish_count > 0:
+                caught = sum(probability * (1 - (1 - share) ** fish_count) for probability, share in self.fishermen)
+                caught = min(caught, fish_count)
+                counts *= 1 - caught / fish_count
+                self.fish_caught_per_season[season_name] += caught
+                self.fish_caught_this_step += caught
+
+    def record_time_series(self, fish_count):
+        self.series['time_step'].append(self.generation_count)
+        self.series['fish_population'].append(float(fish_count))
+        self.series['food_amount'].append(float(self.food_amount))
+        self.series['oxygen_level'].append(float(self.oxygen_level))
+        self.series['fish_born'].append(self.fish_born_this_step)
+        self.series['fish_caught'].append(self.fish_caught_this_step)
+        self.fish_born_this_step = 0.0
+        self.fish_caught_this_step = 0.0
+
+    def time_series(self):
+        return self.series
+
+    def get_stats(self):
+        return {
+            'Fish count': self.fish_count,
+            'Food amount': self.food_amount,
+            'Oxygen level': self.oxygen_level,
+            'Season': SEASON_NAMES[self.current_season],
+        }
+
+    def switch_to_agents(self, lake, seed=None):
+        # Continue in the agent model: replace the fish, plants and scalar state of lake
+        # (built with the same parameters, e.g. by build_simulation) with a sample of this
+        # state. Fish counts per energy level are rounded at random to whole fish, and fish
+        # (or schools) and plants are placed uniformly over the lake. The series recorded here are put
+        # in front of the lake's, so plots and logs cover the whole run.
+        if isinstance(lake, TiledLake):
+            raise ValueError("A TiledLake keeps its fish in worker processes")
+        rng = np.random.default_rng(seed)
+        counts = np.floor(self.energy_counts).astype(np.int64)
+        counts += rng.random(len(counts)) < self.energy_counts - counts
+        # With school_size the fish of every energy level go into schools of up to school_size
+        school_size = lake.school_size or 1
+        full, rest = np.divmod(counts, school_size)
+        energies = np.concatenate([np.repeat(np.arange(len(counts)), full), np.flatnonzero(rest)])
+        sizes = np.concatenate([np.full(full.sum(), school_size), rest[rest > 0]])
+        order = rng.permutation(len(energies))
+        positions = rng.uniform(0, (self.width, self.height), size=(len(energies), 2))
+
+        population = FishPopulation()
+        population.next_fish_id = lake.fish_population.next_fish_id
+        for energy, size, position in zip(energies[order].tolist(), sizes[order].tolist(), positions.tolist()):
+            fish = Fish(id=population.new_id(), energy=energy, position=position, world_size=lake.world_size)
+            fish.count = size
+            population.add(fish)
+        lake.fish_population = population
+
+        plant_count = int(self.plant_count) + int(rng.random() < self.plant_count % 1)
+        lake.plants.remove_many(np.arange(len(lake.plants)))
+        lake.plants.add_many(rng.integers(0, (self.width + 1, self.height + 1), size=(plant_count, 2)))
+
+        lake.food_amount = self.food_amount
+        lake.oxygen_level = self.oxygen_level
+        lake.generation_count = self.generation_count
+        lake.current_season = self.current_season
+        lake.fish_born_per_season = {season: round(count) for season, count in self.fish_born_per_season.items()}
+        lake.fish_caught_per_season = {season: round(count) for season, count in self.fish_caught_per_season.items()}
+        lake.caught_fish_positions = []
+        lake.schedule_retargets()
+
+        if lake.series is not None:
+            for row in zip(*(self.series[name] for name in lake.series.columns)):
+                lake.series.append(**{name: round(value) if name in ('fish_population', 'fish_born', 'fish_caught')
+                                      else value for name, value in zip(lake.series.columns, row)})
+        else:
+            lake.time_steps = list(self.series['time_step']) + lake.time_steps
+            lake.fish_population_log = [round(count) for count in self.series['fish_population']] + lake.fish_population_log
+            lake.food_amount_log = list(self.series['food_amount']) + lake.food_amount_log
+            lake.oxygen_level_log = list(self.series['oxygen_level']) + lake.oxygen_level_log
+        return lake
+
+
+def drift(reference, model, fields=DRIFT_FIELDS):
+    # How far the model series are from the reference series of the same ticks: final
+    # values, mean and largest absolute difference, and the final difference relative to
+    # the reference's range
+    report = {}
+    for name in fields:
+        expected = np.asarray(reference[name], dtype=float)
+        actual = np.asarray(model[name], dtype=float)[:len(expected)]
+        difference = np.abs(actual - expected)
+        scale = max(np.ptp(expected), np.abs(expected).max(), 1.0)
+        report[name] = {
+            'reference_final': float(expected[-1]),
+            'model_final': float(actual[-1]),
+            'mean_abs_drift': float(difference.mean()),
+            'max_abs_drift': float(difference.max()),
+            'final_relative_drift': float(difference[-1] / scale),
+        }
+    return report
+
+
+def calibrate(ticks, seeds=(0, 1, 2), output_dir='calibration', **parameters):
+    # Run the agent model for every seed and the mean-field model from the same start,
+    # and report the drift of the mean-field series from the mean of the agent runs, per
+    # season and over the whole run, next to the spread between the agent runs
+    from headless import DEFAULT_PARAMETERS, build_simulation, prepare_output_dir
+
+    parameters = {**DEFAULT_PARAMETERS, **parameters}
+    agent_runs = []
+    model = None
+    for seed in seeds:
+        run_dir = os.path.join(output_dir, f'seed_{seed}')
+        prepare_output_dir(run_dir)
+        random.seed(seed)
+        lake, fleet = build_simulation(output_dir=run_dir, seed=seed, **parameters)
+        if model is None:
+            model = MeanFieldLake.from_lake(lake, fleet).advance(ticks)
+        for _ in range(ticks):
+            lake.update()
+            fleet.fish(lake)
+        lake.close()
+        agent_runs.append({name: np.asarray(lake.time_series()[name], dtype=float) for name in DRIFT_FIELDS})
+
+    agent_mean = {name: np.mean([run[name] for run in agent_runs], axis=0) for name in DRIFT_FIELDS}
+    agent_spread = {name: float(np.mean(np.std([run[name] for run in agent_runs], axis=0))) for name in DRIFT_FIELDS}
+    series = model.time_series()
+    season_length = parameters['season_length']
+    seasons = []
+    for start in range(0, ticks, season_length):
+        end = min(start + season_length, ticks)
+        seasons.append({
+            'first_tick': start + 1,
+            'season': SEASON_NAMES[((start + 1) // season_length) % 4],
+            'drift': drift({name: values[start:end] for name, values in agent_mean.items()},
+                           {name: series[name][start:end] for name in DRIFT_FIELDS}),
+        })
+    report = {
+        'ticks': ticks,
+        'seeds': list(seeds),
+        'parameters': {name: value for name, value in parameters.items() if name != 'extra_fishermen'},
+        'agent_spread': agent_spread,
+        'drift': drift(agent_mean, series),
+        'seasons': seasons,
+    }
+    with open(os.path.join(output_dir, 'drift.json'), 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the mean-field fast-forward with the agent model.')
+    parser.add_argument('--ticks', type=int, default=1000, help='number of time steps to compare')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2], help='seeds of the agent runs')
+    parser.add_argument('--output', default='calibration', help='output folder (default: calibration)')
+    parser.add_argument('--fish', type=int, dest='initial_fish_count')
+    parser.add_argument('--plants', type=int, dest='initial_plant_count')
+    parser.add_argument('--reproduction-interval', type=int, dest='reproduction_interval')
+    parser.add_argument('--season-length', type=int, dest='season_length')
+    args = parser.parse_args(argv)
+
+    parameters = {name: getattr(args, name) for name in ('initial_fish_count', 'initial_plant_count',
+                                                        'reproduction_interval', 'season_length')
+                  if getattr(args, name) is not None}
+    report = calibrate(args.ticks, args.seeds, args.output, **parameters)
+    print(f"{'series':<16}{'agents':>12}{'mean-field':>12}{'mean drift':>12}{'max drift':>12}{'seed spread':>12}")
+    for name, values in report['drift'].items():
+        print(f"{name:<16}{values['reference_final']:>12.2f}{values['model_final']:>12.2f}"
+              f"{values['mean_abs_drift']:>12.2f}{values['max_abs_drift']:>12.2f}{report['agent_spread'][name]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
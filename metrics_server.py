@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+SEASON_NAMES = ["Spring", "Summer", "Fall", "Winter"]
+
+
+def lake_sample(lake):
+    # The stats line, the season counters and the phase times of the last tick in milliseconds
+    return {
+        'tick': lake.generation_count,
+        'fish_count': int(lake.fish_count),
+        'food_amount': float(lake.food_amount),
+        'oxygen_level': float(lake.oxygen_level),
+        'season': SEASON_NAMES[lake.current_season],
+        'fish_born_per_season': {season: int(count) for season, count in lake.fish_born_per_season.items()},
+        'fish_caught_per_season': {season: int(count) for season, count in lake.fish_caught_per_season.items()},
+        'timings': {name: 1000 * samples[-1] for name, samples in lake.timer.samples.items() if samples},
+    }
+
+
+class MetricsServer:
+    # Streams lake samples to local HTTP clients. The server is an asyncio loop in a
+    # daemon thread; publish() runs on the simulation thread and only appends a sample to
+    # a bounded deque, dropping the oldest when the server falls behind, so a slow or
+    # absent client never holds up the simulation. Every client has its own bounded queue
+    # and loses its oldest samples when it cannot keep up; the sequence numbers show gaps.
+    #   GET /stream  Server-Sent Events, one JSON sample per event
+    #   GET /latest  the latest sample as JSON
+    # Only every `every`-th call to publish makes a sample, and at most one per min_interval seconds.
+    def __init__(self, host='127.0.0.1', port=8765, every=1, min_interval=0.1, queue_size=256, client_queue_size=64,
+                 poll_interval=0.02):
+        if every < 1:
+            raise ValueError(f"every must be at least 1, got {every}")
+        self.host = host
+        self.port = port
+        self.every = every
+        self.min_interval = min_interval
+        self.client_queue_size = client_queue_size
+        self.poll_interval = poll_interval
+        self.samples = deque(maxlen=queue_size)
+        self.calls = 0
+        self.sequence = 0
+        self.last_sample = None
+        self.latest = None
+        self.clients = {}
+        self.streams = set()
+        self.loop = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        # Returns once the port is bound, or raises why it could not be; with port=0
+        # self.port is the port picked
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name='metrics-server', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            self.thread = None
+            raise self.error
+        return self
+
+    def publish(self, lake):
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return
+        now = time.monotonic()
+        if self.last_sample is not None and now - self.last_sample < self.min_interval:
+            return
+        self.last_sample = now
+        sample = lake_sample(lake)
+        sample['sequence'] = self.sequence
+        self.sequence += 1
+        self.samples.append(sample)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join()
+        self.thread = None
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = server.sockets[0].getsockname()[1]
+        except OSError as error:
+            self.error = error
+            return
+        finally:
+            self.ready.set()
+        pump = asyncio.create_task(self.pump())
+        await self.stopping.wait()
+        pump.cancel()
+        server.close()
+        # Let the streams end on their own so no task is left to cancel when the loop closes
+        streams = list(self.streams)
+        for queue, writer in self.clients.items():
+            writer.transport.abort()
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        await asyncio.gather(*streams, return_exceptions=True)
+
+    async def pump(self):
+        # Hand the published samples to the clients, serialized once for all of them
+        while True:
+            while self.samples:
+                self.latest = json.dumps(self.samples.popleft())
+                message = f"data: {self.latest}\n\n".encode()
+                for queue in self.clients:
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(message)
+            await asyncio.sleep(self.poll_interval)
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while await asyncio.wait_for(reader.readline(), 5) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if path == '/stream':
+                await self.stream(writer)
+                return
+            if path == '/latest':
+                status, body = '200 OK', (self.latest or 'null').encode()
+            else:
+                status, body = '404 Not Found', b'{"error": "use /stream or /latest"}'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                         f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n")
+        queue = asyncio.Queue(maxsize=self.client_queue_size)
+        if self.latest is not None:
+            queue.put_nowait(f"data: {self.latest}\n\n".encode())
+        self.clients[queue] = writer
+        self.streams.add(asyncio.current_task())
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        finally:
+            del self.clients[queue]
+            self.streams.discard(asyncio.current_task())
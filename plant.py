@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Plant:
     def __init__(self, position):
         self.position = position
@@ -5,3 +8,61 @@ class Plant:
 
     def generate_food(self):
         self.food_amount += 0.5
+
+
+class PlantStore:
+    # Array-backed plant collection: positions and food amounts live in dense slots,
+    # removal swaps surviving plants from the end into the freed slots
+    def __init__(self, plants=(), capacity=16):
+        capacity = max(capacity, len(plants))
+        self.positions = np.empty((capacity, 2))
+        self.food_amounts = np.empty(capacity)
+        self.count = 0
+        if len(plants):
+            self.add_many([plant.position for plant in plants], [plant.food_amount for plant in plants])
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, slot):
+        if not -self.count <= slot < self.count:
+            raise IndexError(slot)
+        plant = Plant(position=tuple(self.positions[slot].tolist()))
+        plant.food_amount = float(self.food_amounts[slot])
+        return plant
+
+    def __iter__(self):
+        for slot in range(self.count):
+            yield self[slot]
+
+    @property
+    def active_positions(self):
+        return self.positions[:self.count]
+
+    def add(self, plant):
+        self.add_many([plant.position], [plant.food_amount])
+
+    def add_many(self, positions, food_amounts=None):
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        new_count = self.count + len(positions)
+        if new_count > len(self.positions):
+            capacity = max(new_count, 2 * len(self.positions))
+            self.positions = np.resize(self.positions, (capacity, 2))
+            self.food_amounts = np.resize(self.food_amounts, capacity)
+        self.positions[self.count:new_count] = positions
+        self.food_amounts[self.count:new_count] = 10 if food_amounts is None else food_amounts
+        self.count = new_count
+
+    def remove_many(self, slots):
+        slots = np.unique(slots)
+        if len(slots) == 0:
+            return
+        new_count = self.count - len(slots)
+        holes = slots[slots < new_count]
+        survivors = np.setdiff1d(np.arange(new_count, self.count), slots, assume_unique=True)
+        self.positions[holes] = self.positions[survivors]
+        self.food_amounts[holes] = self.food_amounts[survivors]
+        self.count = new_count
+
+    def generate_food(self):
+        self.food_amounts[:self.count] += 0.5
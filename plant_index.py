@@ -0,0 +1,56 @@
+import numpy as np
+
+from spatial_grid import neighbor_pairs
+
+
+class PlantIndex:
+    # Nearest-food queries over the coordinate array of a PlantStore. The store keeps
+    # its plants in dense slots, so the index always sees the current plants without
+    # being told about additions and removals.
+    def __init__(self, store, cell_size=None):
+        # Without a fixed cell_size the cells are sized to hold a couple of plants each
+        self.store = store
+        self.cell_size = cell_size
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def coordinates(self):
+        return self.store.active_positions
+
+    def nearest(self, position):
+        slots = self.nearest_many(np.asarray(position, dtype=float).reshape(1, 2))
+        return self.store[slots[0]] if slots[0] >= 0 else None
+
+    def nearest_many(self, positions):
+        # Slot of the closest plant for every row of positions, -1 when there are none
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        closest = np.full(len(positions), -1, dtype=np.intp)
+        coordinates = self.coordinates
+        if len(coordinates) == 0 or len(positions) == 0:
+            return closest
+
+        # Any plant closer than one cell is found by the grid query, and then the
+        # closest of those is the closest overall
+        cell_size = self.cell_size
+        if cell_size is None:
+            area = max(np.prod(np.ptp(coordinates, axis=0)), 1.0)
+            cell_size = max(np.sqrt(2 * area / len(coordinates)), 1.0)
+        i, j, d = neighbor_pairs(positions, cell_size, coordinates, exclude_coincident=False)
+        if len(i):
+            order = np.lexsort((d, i))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = i[order][1:] != i[order][:-1]
+            closest[i[order][first]] = j[order][first]
+
+        # Fish with no plant within a cell fall back to a chunked brute-force search
+        missing = np.flatnonzero(closest < 0)
+        chunk = max(1, 1_000_000 // len(coordinates))
+        for start in range(0, len(missing), chunk):
+            rows = missing[start:start + chunk]
+            block = positions[rows]
+            distances = np.hypot(block[:, None, 0] - coordinates[None, :, 0],
+                                 block[:, None, 1] - coordinates[None, :, 1])
+            closest[rows] = distances.argmin(axis=1)
+        return closest
@@ -0,0 +1,81 @@
+from collections.abc import Sequence
+
+
+class FishPopulation(Sequence):
+    # Fish in dense slots with an id -> slot map. Removal swaps the last fish into the
+    # freed slot, and deaths during a tick are only marked and compacted at the end so
+    # the population can be iterated safely while fish die.
+    def __init__(self, fish=()):
+        self.fish = []
+        self.slots = {}
+        self.dead = []
+        self.next_fish_id = 0
+        for member in fish:
+            self.add(member)
+
+    def __len__(self):
+        return len(self.fish)
+
+    def __getitem__(self, slot):
+        return self.fish[slot]
+
+    def __iter__(self):
+        return iter(self.fish)
+
+    def __contains__(self, fish):
+        slot = self.slots.get(fish.id)
+        return slot is not None and self.fish[slot] is fish
+
+    def new_id(self):
+        # Ids come from a counter that only moves forward, so they are never reused
+        fish_id = self.next_fish_id
+        self.next_fish_id += 1
+        return fish_id
+
+    def get(self, fish_id):
+        slot = self.slots.get(fish_id)
+        return None if slot is None else self.fish[slot]
+
+    def add(self, fish):
+        if fish.id in self.slots:
+            raise ValueError(f"Duplicate fish id: {fish.id}")
+        self.slots[fish.id] = len(self.fish)
+        self.fish.append(fish)
+        self.next_fish_id = max(self.next_fish_id, fish.id + 1)
+
+    def index(self, fish):
+        if fish not in self:
+            raise ValueError(f"Fish {fish.id} is not in the population")
+        return self.slots[fish.id]
+
+    def insert(self, slot, fish):
+        # Add a fish at slot, moving the fish after it one slot on
+        if fish.id in self.slots:
+            raise ValueError(f"Duplicate fish id: {fish.id}")
+        self.fish.insert(slot, fish)
+        for k in range(slot, len(self.fish)):
+            self.slots[self.fish[k].id] = k
+        self.next_fish_id = max(self.next_fish_id, fish.id + 1)
+
+    def extend(self, fish):
+        for member in fish:
+            self.add(member)
+
+    def remove(self, fish):
+        if fish not in self:
+            raise ValueError(f"Fish {fish.id} is not in the population")
+        slot = self.slots.pop(fish.id)
+        last = self.fish.pop()
+        if last is not fish:
+            self.fish[slot] = last
+            self.slots[last.id] = slot
+
+    def mark_dead(self, fish):
+        self.dead.append(fish)
+
+    def compact(self):
+        # Remove the fish marked dead during this tick
+        for fish in self.dead:
+            if fish in self:
+                self.remove(fish)
+        self.dead.clear()
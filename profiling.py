@@ -0,0 +1,58 @@
+import csv
+import time
+from collections import deque
+
+
+class PhaseTimer:
+    # Rolling per-phase timings. Call start() and then lap(name) after each phase; lap
+    # records the time since the previous start/lap/split. Whole-run totals are kept as well.
+    def __init__(self, window=300):
+        self.window = window
+        self.samples = {}
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def split(self):
+        # Seconds since the previous start/lap/split, without recording them
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        return elapsed
+
+    def lap(self, name):
+        self.record(name, self.split())
+
+    def record(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+            self.totals[name] = [0, 0.0, 0.0]
+        samples.append(seconds)
+        totals = self.totals[name]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+
+    def stats(self):
+        # Mean, 95th percentile and max in milliseconds over the rolling window
+        stats = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            stats[name] = {
+                'mean': 1000 * sum(ordered) / len(ordered),
+                'p95': 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                'max': 1000 * ordered[-1],
+            }
+        return stats
+
+    def write_profile(self, path):
+        rolling = self.stats()
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['phase', 'calls', 'total_ms', 'mean_ms', 'max_ms', 'recent_mean_ms', 'recent_p95_ms'])
+            for name, (calls, total, longest) in self.totals.items():
+                writer.writerow([name, calls, 1000 * total, 1000 * total / calls, 1000 * longest,
+                                 rolling[name]['mean'], rolling[name]['p95']])
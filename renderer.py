@@ -0,0 +1,73 @@
+import pygame
+
+LAKE_COLOR = (0, 0, 255)
+FISH_COLOR = (255, 255, 255)
+PLANT_COLOR = (0, 255, 0)
+CAUGHT_COLOR = (255, 0, 0)
+AREA_COLOR = (0, 0, 0)
+TEXT_COLOR = (255, 255, 255)
+
+
+def make_circle_sprite(color, radius):
+    sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1), pygame.SRCALPHA)
+    pygame.draw.circle(sprite, color, (radius, radius), radius)
+    return sprite
+
+
+class Renderer:
+    # Draws the lake from pre-rendered sprites with batched Surface.blits calls. The
+    # water and fishing areas are drawn once into a cached background; each frame only
+    # the areas covered by the previous frame's sprites are restored, and only the
+    # changed rectangles are pushed to the display when there are few enough of them.
+    max_dirty_rects = 400
+
+    def __init__(self, screen, fishing_areas, font, small_font=None, scale=1.0):
+        # scale converts lake coordinates to pixels, for lakes of another size than the window
+        self.screen = screen
+        self.scale = scale
+        self.font = font
+        self.small_font = small_font or font
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(LAKE_COLOR)
+        for area in fishing_areas:
+            pygame.draw.rect(self.background, AREA_COLOR, [value * scale for value in area], 2)
+
+        self.fish_sprite = make_circle_sprite(FISH_COLOR, 5)
+        self.plant_sprite = make_circle_sprite(PLANT_COLOR, 10)
+        self.caught_sprite = make_circle_sprite(CAUGHT_COLOR, 5)
+        self.text_cache = {}
+        self.previous_rects = []
+        self.full_redraw = True
+
+    def sprite_blits(self, sprite, positions, radius):
+        scale = self.scale
+        return [(sprite, (int(x * scale) - radius, int(y * scale) - radius)) for x, y in positions]
+
+    def text(self, line, font, slot):
+        # Render a text line only when its content changes
+        cached = self.text_cache.get(slot)
+        if cached is None or cached[0] != line:
+            cached = self.text_cache[slot] = (line, font.render(line, True, TEXT_COLOR))
+        return cached[1]
+
+    def draw(self, fish_positions, plant_positions, caught_positions, stats_line, timings_line=None):
+        screen = self.screen
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+        else:
+            screen.blits([(self.background, rect, rect) for rect in self.previous_rects], doreturn=False)
+
+        rects = screen.blits(self.sprite_blits(self.plant_sprite, plant_positions, 10))
+        rects += screen.blits(self.sprite_blits(self.fish_sprite, fish_positions, 5))
+        rects += screen.blits(self.sprite_blits(self.caught_sprite, caught_positions, 5))
+        rects.append(screen.blit(self.text(stats_line, self.font, 'stats'), (10, 10)))
+        if timings_line is not None:
+            rects.append(screen.blit(self.text(timings_line, self.small_font, 'timings'), (10, 34)))
+
+        dirty = self.previous_rects + rects
+        if self.full_redraw or len(dirty) > self.max_dirty_rects:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        self.previous_rects = rects
+        self.full_redraw = False
@@ -0,0 +1,189 @@
+import random
+
+import numpy as np
+from pygame.math import Vector2
+
+from spatial_grid import neighbor_pairs
+
+# Default lake size, the same as Fish uses
+WORLD_WIDTH, WORLD_HEIGHT = 800, 600
+
+
+def _length(vectors):
+    return np.hypot(vectors[:, 0], vectors[:, 1])
+
+
+def _normalize(vectors):
+    lengths = _length(vectors)
+    result = np.zeros_like(vectors)
+    nonzero = lengths > 0
+    result[nonzero] = vectors[nonzero] / lengths[nonzero, None]
+    return result
+
+
+def _limit(vectors, max_length):
+    lengths = _length(vectors)
+    too_long = lengths > max_length
+    vectors[too_long] *= (max_length / lengths[too_long])[:, None]
+    return vectors
+
+
+class School:
+    # Struct-of-arrays view of a fish population. Every fish is stepped at once from
+    # the positions and velocities at the start of the tick, instead of one after the
+    # other as Fish.move does, so results match the object path up to update order.
+    def __init__(self, ids, energy, positions, velocities, targets, change_target_time, max_speed=2, max_force=0.1,
+                 world_size=(WORLD_WIDTH, WORLD_HEIGHT)):
+        self.ids = ids
+        self.energy = energy
+        self.positions = positions
+        self.velocities = velocities
+        self.targets = targets
+        self.change_target_time = change_target_time
+        self.max_speed = max_speed
+        self.max_force = max_force
+        self.world_size = world_size
+        # Fish.flocking_goals as three (n, 2) arrays, NaN where a fish has no such goal;
+        # only kept when the lake staggers the neighbor lookups
+        self.flocking_goals = None
+
+    @classmethod
+    def from_fish(cls, fish_population, world_size=(WORLD_WIDTH, WORLD_HEIGHT), flocking_goals=False):
+        count = len(fish_population)
+        school = cls(
+            np.fromiter((fish.id for fish in fish_population), dtype=np.int64, count=count),
+            np.fromiter((fish.energy for fish in fish_population), dtype=np.int64, count=count),
+            np.array([tuple(fish.position) for fish in fish_population], dtype=float).reshape(count, 2),
+            np.array([tuple(fish.velocity) for fish in fish_population], dtype=float).reshape(count, 2),
+            np.array([tuple(fish.target) for fish in fish_population], dtype=float).reshape(count, 2),
+            np.fromiter((fish.change_target_time for fish in fish_population), dtype=np.int64, count=count),
+            world_size=world_size,
+        )
+        if count:
+            school.max_speed = fish_population[0].max_speed
+            school.max_force = fish_population[0].max_force
+        if flocking_goals:
+            school.flocking_goals = tuple(np.full((count, 2), np.nan) for _ in range(3))
+            for k, fish in enumerate(fish_population):
+                if fish.flocking_goals is not None:
+                    for goals, goal in zip(school.flocking_goals, fish.flocking_goals):
+                        if goal is not None:
+                            goals[k] = tuple(goal)
+        return school
+
+    def write_back(self, fish_population, flocking_goals=False):
+        for k, fish in enumerate(fish_population):
+            fish.energy = int(self.energy[k])
+            fish.position.update(self.positions[k, 0], self.positions[k, 1])
+            fish.velocity.update(self.velocities[k, 0], self.velocities[k, 1])
+            fish.target.update(self.targets[k, 0], self.targets[k, 1])
+            fish.change_target_time = int(self.change_target_time[k])
+        if flocking_goals and self.flocking_goals is not None:
+            for k, fish in enumerate(fish_population):
+                fish.flocking_goals = tuple(None if np.isnan(goals[k, 0]) else Vector2(*goals[k]) for goals in self.flocking_goals)
+
+    def start_move(self, countdown=True):
+        # The bookkeeping part of Fish.move, for every fish at once; returns which fish move
+        alive = self.energy > 0
+        self.energy[~alive] = 0
+        self.energy[alive] -= 1
+        if not countdown:
+            return alive
+        self.change_target_time[alive] -= 1
+
+        # Retarget in population order so the random stream matches Fish.move
+        for k in np.flatnonzero(alive & (self.change_target_time <= 0)):
+            self.targets[k] = (random.randint(0, self.world_size[0]), random.randint(0, self.world_size[1]))
+            self.change_target_time[k] = random.randint(30, 90)
+        return alive
+
+    def move(self, plant_index, countdown=True, flocking_due=None):
+        alive = self.start_move(countdown)
+        acceleration = self.steer(plant_index, flocking_due)
+        velocities = self.velocities[alive] + acceleration[alive]
+        velocities = _limit(velocities, self.max_speed)
+        self.velocities[alive] = velocities
+        self.positions[alive] += velocities
+        np.clip(self.positions[:, 0], 0, self.world_size[0], out=self.positions[:, 0])
+        np.clip(self.positions[:, 1], 0, self.world_size[1], out=self.positions[:, 1])
+
+    def steer(self, plant_index, flocking_due=None):
+        # One neighbor query at the largest radius serves all three flocking rules. With
+        # flocking_due only those fish look at their neighbors; the rest keep their goals.
+        if flocking_due is None or self.flocking_goals is None:
+            self.flocking_goals = self.neighbor_goals(neighbor_pairs(self.positions, 50))
+        else:
+            rows = np.flatnonzero(flocking_due)
+            i, j, d = neighbor_pairs(self.positions[rows], 50, self.positions)
+            for goals, new in zip(self.flocking_goals, self.neighbor_goals((rows[i], j, d))):
+                goals[rows] = new[rows]
+        separation_velocity, alignment_velocity, neighbor_center = self.flocking_goals
+        flocking = self.steer_towards(alignment_velocity)
+        has_center = ~np.isnan(neighbor_center[:, 0])
+        flocking[has_center] += self._seek(neighbor_center[has_center], has_center)
+        acceleration = self.steer_towards(separation_velocity) * 1.5
+        acceleration += flocking
+        acceleration += self.seek_food(plant_index) * 2.0
+        acceleration += self.seek(self.targets) * 2.0
+        return acceleration
+
+    def neighbor_goals(self, pairs):
+        # Fish.neighbor_goals for every fish at once, NaN where a fish has no such goal
+        desired_separation = 20
+        count = len(self.positions)
+        i, j, d = pairs
+        separation_velocity = np.full((count, 2), np.nan)
+        alignment_velocity = np.full((count, 2), np.nan)
+        neighbor_center = np.full((count, 2), np.nan)
+
+        # Separation
+        close = d < desired_separation
+        ci, cj, cd = i[close], j[close], d[close]
+        diff = (self.positions[ci] - self.positions[cj]) / (cd * cd)[:, None]
+        # bincount returns integers when there are no pairs at all
+        away = np.column_stack((
+            np.bincount(ci, weights=diff[:, 0], minlength=count),
+            np.bincount(ci, weights=diff[:, 1], minlength=count),
+        )).astype(float)
+        close_neighbors = np.bincount(ci, minlength=count)
+        has_close = close_neighbors > 0
+        away[has_close] /= close_neighbors[has_close, None]
+        steering = _length(away) > 0
+        separation_velocity[steering] = _normalize(away[steering]) * self.max_speed
+
+        # Alignment and cohesion
+        neighbors = np.bincount(i, minlength=count)
+        has_neighbors = neighbors > 0
+        if has_neighbors.any():
+            def neighbor_mean(values):
+                totals = np.column_stack((
+                    np.bincount(i, weights=values[j, 0], minlength=count),
+                    np.bincount(i, weights=values[j, 1], minlength=count),
+                ))
+                return totals[has_neighbors] / neighbors[has_neighbors, None]
+
+            alignment_velocity[has_neighbors] = _normalize(neighbor_mean(self.velocities)) * self.max_speed
+            neighbor_center[has_neighbors] = neighbor_mean(self.positions)
+        return separation_velocity, alignment_velocity, neighbor_center
+
+    def steer_towards(self, velocities):
+        # Limited steering force towards desired velocities, zero where they are NaN
+        force = np.zeros_like(self.positions)
+        rows = ~np.isnan(velocities[:, 0])
+        force[rows] = _limit(velocities[rows] - self.velocities[rows], self.max_force)
+        return force
+
+    def seek(self, targets):
+        return self._seek(targets, slice(None))
+
+    def _seek(self, targets, rows):
+        desired = _normalize(targets - self.positions[rows]) * self.max_speed
+        return _limit(desired - self.velocities[rows], self.max_force)
+
+    def seek_food(self, plant_index):
+        force = np.zeros_like(self.positions)
+        closest = plant_index.nearest_many(self.positions)
+        has_food = closest >= 0
+        if has_food.any():
+            force[has_food] = self._seek(plant_index.coordinates[closest[has_food]], has_food)
+        return force
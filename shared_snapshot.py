@@ -0,0 +1,157 @@
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from headless import build_simulation
+from timestep import PAUSED, REAL_TIME, StepScheduler
+
+SEASON_NAMES = ["Spring", "Summer", "Fall", "Winter"]
+
+# Per-buffer header: sequence number, fish/plant/caught counts, generation, season,
+# total fish count (the position arrays are capped at their capacity)
+HEADER_SIZE = 7
+SEQUENCE, FISH, PLANTS, CAUGHT, GENERATION, SEASON, FISH_TOTAL = range(HEADER_SIZE)
+
+
+class SnapshotBuffer:
+    # Double-buffered lake snapshot in shared memory. The writer fills the buffer that
+    # is not currently published, bumping its sequence number to odd while writing and
+    # back to even when done, then publishes it. The reader copies the published
+    # arrays and retries if the sequence number changed meanwhile.
+    def __init__(self, max_fish=50000, max_plants=50000, max_caught=4096, name=None):
+        self.capacities = (max_fish, max_plants, max_caught)
+        buffer_size = 8 * HEADER_SIZE + 8 * 2 + 4 * 2 * (max_fish + max_plants + max_caught)
+        self.buffer_size = buffer_size
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=8 + 2 * buffer_size)
+        self.published = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.buffers = [self._views(8 + k * buffer_size) for k in range(2)]
+        if name is None:
+            self.published[0] = -1
+            for views in self.buffers:
+                views['header'][:] = 0
+
+    def _views(self, offset):
+        max_fish, max_plants, max_caught = self.capacities
+        views = {}
+        views['header'] = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * HEADER_SIZE
+        views['levels'] = np.ndarray((2,), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += 8 * 2
+        for key, capacity in (('fish', max_fish), ('plants', max_plants), ('caught', max_caught)):
+            views[key] = np.ndarray((capacity, 2), dtype=np.float32, buffer=self.shm.buf, offset=offset)
+            offset += 4 * 2 * capacity
+        return views
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, lake):
+        target = 0 if self.published[0] != 0 else 1
+        views = self.buffers[target]
+        header = views['header']
+        header[SEQUENCE] += 1
+
+        counts = []
+        for key, positions in (('fish', [tuple(fish.position) for fish in lake.fish_population]),
+                               ('plants', lake.plants.active_positions),
+                               ('caught', [tuple(pos) for pos, _ in lake.caught_fish_positions])):
+            count = min(len(positions), len(views[key]))
+            if count:
+                views[key][:count] = np.asarray(positions, dtype=np.float32).reshape(-1, 2)[:count]
+            counts.append(count)
+        header[FISH], header[PLANTS], header[CAUGHT] = counts
+        header[GENERATION] = lake.generation_count
+        header[SEASON] = lake.current_season
+        header[FISH_TOTAL] = lake.fish_count
+        views['levels'][:] = (lake.food_amount, lake.oxygen_level)
+
+        header[SEQUENCE] += 1
+        self.published[0] = target
+
+    def read(self):
+        # Latest complete snapshot, or None before the first publish
+        while True:
+            source = int(self.published[0])
+            if source < 0:
+                return None
+            views = self.buffers[source]
+            sequence = int(views['header'][SEQUENCE])
+            if sequence % 2:
+                continue
+            header = views['header'].copy()
+            food, oxygen = views['levels']
+            snapshot = {
+                'fish': views['fish'][:header[FISH]].copy(),
+                'plants': views['plants'][:header[PLANTS]].copy(),
+                'caught': views['caught'][:header[CAUGHT]].copy(),
+                'stats': {
+                    'Fish count': int(header[FISH_TOTAL]),
+                    'Food amount': float(food),
+                    'Oxygen level': float(oxygen),
+                    'Season': SEASON_NAMES[header[SEASON]],
+                },
+                'generation': int(header[GENERATION]),
+            }
+            if int(views['header'][SEQUENCE]) == sequence:
+                return snapshot
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def simulation_worker(parameters, buffer_name, capacities, commands, speed=1.0, mode=REAL_TIME, metrics_port=None):
+    # Runs the lake in its own process and publishes a snapshot after every step.
+    # commands is a queue of ('pause',), ('step',), ('max_speed',), ('faster',),
+    # ('slower',) or ('stop',) messages from the window process. With metrics_port the
+    # stats are also streamed from this process (metrics_server.py).
+    buffer = SnapshotBuffer(*capacities, name=buffer_name)
+    lake, fleet = build_simulation(**parameters)
+    metrics = None
+    if metrics_port is not None:
+        from metrics_server import MetricsServer
+        metrics = MetricsServer(port=metrics_port).start()
+
+    def step():
+        lake.update()
+        lake.timer.start()
+        fleet.fish(lake)
+        lake.timer.lap('fishing')
+        buffer.publish(lake)
+        if metrics is not None:
+            metrics.publish(lake)
+
+    buffer.publish(lake)
+    scheduler = StepScheduler(ticks_per_second=60, speed=speed, mode=mode)
+    actions = {'pause': scheduler.toggle_pause, 'step': scheduler.step_once, 'max_speed': scheduler.toggle_max_speed,
+               'faster': scheduler.faster, 'slower': scheduler.slower}
+    last = time.perf_counter()
+    running = True
+    while running:
+        while running:
+            try:
+                command = commands.get_nowait()[0]
+            except queue.Empty:
+                break
+            if command == 'stop':
+                running = False
+            else:
+                actions[command]()
+        now = time.perf_counter()
+        if running:
+            scheduler.run_frame(step, now - last)
+        last = now
+        if scheduler.mode == PAUSED or scheduler.mode == REAL_TIME:
+            time.sleep(1 / 240)
+
+    if metrics is not None:
+        metrics.close()
+    lake.close()
+    lake.plot_stats()
+    lake.plot_time_series()
+    buffer.close()
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.fish_cells = {}
+
+    def cell_of(self, position):
+        return int(position[0] // self.cell_size), int(position[1] // self.cell_size)
+
+    def rebuild(self, fish_population):
+        # Bucket every fish by the cell it currently occupies
+        self.cells = {}
+        self.fish_cells = {}
+        for fish in fish_population:
+            self.insert(fish)
+
+    def insert(self, fish):
+        cell = self.cell_of(fish.position)
+        self.cells.setdefault(cell, []).append(fish)
+        self.fish_cells[id(fish)] = cell
+
+    def remove(self, fish):
+        cell = self.fish_cells.pop(id(fish), None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        bucket.remove(fish)
+        if not bucket:
+            del self.cells[cell]
+
+    def update(self, fish):
+        # Move a fish to its new cell after it has changed position
+        cell = self.cell_of(fish.position)
+        if self.fish_cells.get(id(fish)) != cell:
+            self.remove(fish)
+            self.insert(fish)
+
+    def neighbors(self, position):
+        # Fish in the 3x3 block of cells around position; with cells as wide as the
+        # neighbor radius this covers every fish that can be within that radius
+        cx, cy = self.cell_of(position)
+        nearby = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bucket = self.cells.get((cx + dx, cy + dy))
+                if bucket:
+                    nearby.extend(bucket)
+        return nearby
+
+
+def neighbor_pairs(positions, radius, others=None, exclude_coincident=True):
+    # Vectorized counterpart of SpatialGrid.neighbors: bucket `others` (default: positions)
+    # into cells of size radius and return index arrays (i, j) and distances d for every
+    # pair with 0 < d < radius, where i indexes positions and j indexes others.
+    # With exclude_coincident=False pairs at distance 0 are kept as well.
+    if others is None:
+        others = positions
+    empty = np.empty(0, dtype=np.intp)
+    if len(positions) == 0 or len(others) == 0:
+        return empty, empty, np.empty(0)
+
+    origin = np.minimum(positions.min(axis=0), others.min(axis=0))
+    other_cells = ((others - origin) // radius).astype(np.int64) + 1
+    query_cells = ((positions - origin) // radius).astype(np.int64) + 1
+    stride = max(other_cells[:, 1].max(), query_cells[:, 1].max()) + 2
+
+    # Sort the other points by cell key so each occupied cell is one contiguous run
+    keys = other_cells[:, 0] * stride + other_cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    cell_keys, cell_starts, cell_counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    query_index = np.arange(len(positions))
+    i_parts, j_parts = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            wanted = (query_cells[:, 0] + dx) * stride + query_cells[:, 1] + dy
+            slot = np.searchsorted(cell_keys, wanted)
+            slot[slot == len(cell_keys)] = 0
+            hit = cell_keys[slot] == wanted
+            if not hit.any():
+                continue
+            starts = cell_starts[slot[hit]]
+            counts = cell_counts[slot[hit]]
+            run_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            i_parts.append(np.repeat(query_index[hit], counts))
+            j_parts.append(order[np.repeat(starts, counts) + run_offsets])
+
+    if not i_parts:
+        return empty, empty, np.empty(0)
+    i = np.concatenate(i_parts)
+    j = np.concatenate(j_parts)
+    offsets = positions[i] - others[j]
+    squared = np.einsum('ij,ij->i', offsets, offsets)
+    close = squared < radius * radius
+    if exclude_coincident:
+        close &= squared > 0
+    return i[close], j[close], np.sqrt(squared[close])
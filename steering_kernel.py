@@ -0,0 +1,207 @@
+import math
+
+import numpy as np
+
+# Numba is optional: without it the same kernel runs as plain Python on lists
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+
+@njit(cache=True)
+def _limit(x, y, max_length):
+    length = math.sqrt(x * x + y * y)
+    if length > max_length:
+        return x / length * max_length, y / length * max_length
+    return x, y
+
+
+@njit(cache=True)
+def _seek(px, py, vx, vy, tx, ty, max_speed, max_force):
+    dx = tx - px
+    dy = ty - py
+    length = math.sqrt(dx * dx + dy * dy)
+    if length > 0:
+        dx = dx / length * max_speed
+        dy = dy / length * max_speed
+    return _limit(dx - vx, dy - vy, max_force)
+
+
+@njit(cache=True)
+def _first_at_least(values, value):
+    # Binary search in a sorted sequence, like np.searchsorted(values, value)
+    low, high = 0, len(values)
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+@njit(cache=True)
+def _move_and_feed(x, y, vx, vy, tx, ty, energy, alive, food_x, food_y, has_food, sep_goal_x, sep_goal_y, align_goal_x,
+                   align_goal_y, center_x, center_y, flocking_due, rank, keys, origin_x, origin_y, cell_size, rows, food_amount, max_speed, max_force, width, height, dead):
+    # Fish.move for every fish in population order, followed by the feeding and death
+    # check of the Lake.update loop. Fish are updated in place, so later fish see the
+    # new positions and velocities of earlier ones exactly as in the object path.
+    # x, y, vx, vy and dead are stored sorted by cell key (fish k is at rank[k]) so only
+    # occupied cells take up space. The cells come from the start-of-tick positions and
+    # are wider than the neighbor radius plus a step, so fish that moved since are still found.
+    # Only fish with flocking_due look at their neighbors; the others steer by the goals
+    # (in population order) from the last time they did.
+    for k in range(len(rank)):
+        s = rank[k]
+        if alive[k]:
+            px = x[s]
+            py = y[s]
+            if flocking_due[k]:
+                sep_x = sep_y = 0.0
+                sep_count = 0
+                sum_vx = sum_vy = sum_px = sum_py = 0.0
+                count = 0
+                cx = int((px - origin_x) // cell_size)
+                cy = int((py - origin_y) // cell_size)
+                for gx in range(max(cx - 1, 0), cx + 2):
+                    # The three cells of a column next to each other are one run of keys
+                    start = _first_at_least(keys, gx * rows + max(cy - 1, 0))
+                    end = _first_at_least(keys, gx * rows + min(cy + 1, rows - 1) + 1)
+                    for o in range(start, end):
+                        if o == s or dead[o]:
+                            continue
+                        dx = px - x[o]
+                        dy = py - y[o]
+                        squared = dx * dx + dy * dy
+                        if squared >= 2500 or squared == 0:
+                            continue
+                        distance = math.sqrt(squared)
+                        if distance >= 50:
+                            continue
+                        sum_vx += vx[o]
+                        sum_vy += vy[o]
+                        sum_px += x[o]
+                        sum_py += y[o]
+                        count += 1
+                        if distance < 20:
+                            sep_x += dx / distance / distance
+                            sep_y += dy / distance / distance
+                            sep_count += 1
+
+                # The goals of Fish.neighbor_goals, NaN where there are none
+                if sep_count > 0:
+                    sep_x /= sep_count
+                    sep_y /= sep_count
+                length = math.sqrt(sep_x * sep_x + sep_y * sep_y)
+                sep_goal_x[k] = sep_goal_y[k] = math.nan
+                if length > 0:
+                    sep_goal_x[k] = sep_x / length * max_speed
+                    sep_goal_y[k] = sep_y / length * max_speed
+                align_goal_x[k] = align_goal_y[k] = center_x[k] = center_y[k] = math.nan
+                if count > 0:
+                    avg_x = sum_vx / count
+                    avg_y = sum_vy / count
+                    length = math.sqrt(avg_x * avg_x + avg_y * avg_y)
+                    if length > 0:
+                        avg_x = avg_x / length * max_speed
+                        avg_y = avg_y / length * max_speed
+                    align_goal_x[k] = avg_x
+                    align_goal_y[k] = avg_y
+                    center_x[k] = sum_px / count
+                    center_y[k] = sum_py / count
+
+            # Flocking forces from the goals and this fish's current velocity
+            sep_x = sep_y = align_x = align_y = cohesion_x = cohesion_y = 0.0
+            if not math.isnan(sep_goal_x[k]):
+                sep_x, sep_y = _limit(sep_goal_x[k] - vx[s], sep_goal_y[k] - vy[s], max_force)
+            if not math.isnan(align_goal_x[k]):
+                align_x, align_y = _limit(align_goal_x[k] - vx[s], align_goal_y[k] - vy[s], max_force)
+                cohesion_x, cohesion_y = _seek(px, py, vx[s], vy[s], center_x[k], center_y[k], max_speed, max_force)
+
+            food_force_x = food_force_y = 0.0
+            if has_food[k]:
+                food_force_x, food_force_y = _seek(px, py, vx[s], vy[s], food_x[k], food_y[k], max_speed, max_force)
+            target_x, target_y = _seek(px, py, vx[s], vy[s], tx[k], ty[k], max_speed, max_force)
+
+            ax = sep_x * 1.5 + align_x * 1.0 + cohesion_x * 1.0 + food_force_x * 2.0 + target_x * 2.0
+            ay = sep_y * 1.5 + align_y * 1.0 + cohesion_y * 1.0 + food_force_y * 2.0 + target_y * 2.0
+            new_vx = vx[s] + ax
+            new_vy = vy[s] + ay
+            speed = math.sqrt(new_vx * new_vx + new_vy * new_vy)
+            if speed > max_speed:
+                new_vx *= max_speed / speed
+                new_vy *= max_speed / speed
+            vx[s] = new_vx
+            vy[s] = new_vy
+            x[s] = max(0.0, min(px + new_vx, width))
+            y[s] = max(0.0, min(py + new_vy, height))
+
+        if food_amount > 0:
+            energy[k] += 1
+            food_amount -= 1
+        if energy[k] <= 0:
+            dead[s] = True
+    return food_amount
+
+
+def move_and_feed(school, plant_index, food_amount, countdown=True, flocking_due=None):
+    # Move, feed and check every fish of the school in one pass; returns the remaining
+    # food and a mask of the fish that died. Without flocking_due every fish looks at its
+    # neighbors; with it the others use school.flocking_goals, which are updated.
+    count = len(school.positions)
+    if not count:
+        return food_amount, np.zeros(0, dtype=bool)
+
+    # Nearest food from the start-of-tick positions, as in the object path
+    closest = plant_index.nearest_many(school.positions)
+    has_food = closest >= 0
+    food = np.zeros((count, 2))
+    food[has_food] = plant_index.coordinates[closest[has_food]]
+    alive = school.start_move(countdown)
+    if flocking_due is None or school.flocking_goals is None:
+        flocking_due = np.ones(count, dtype=bool)
+        goals = [np.full(count, np.nan) for _ in range(6)]
+    else:
+        goals = [np.ascontiguousarray(array[:, axis]) for array in school.flocking_goals for axis in (0, 1)]
+
+    # Fish sorted by cell key, so a cell is a run of the sorted keys
+    cell_size = 50 + 2 * school.max_speed
+    origin = school.positions.min(axis=0)
+    cells = ((school.positions - origin) // cell_size).astype(np.int64)
+    rows = cells[:, 1].max() + 1
+    keys = cells[:, 0] * rows + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    rank = np.empty(count, dtype=np.int64)
+    rank[order] = np.arange(count)
+
+    positions = school.positions[order]
+    velocities = school.velocities[order]
+    dead = np.zeros(count, dtype=bool)
+    arrays = [positions[:, 0].copy(), positions[:, 1].copy(), velocities[:, 0].copy(), velocities[:, 1].copy(),
+              school.targets[:, 0].copy(), school.targets[:, 1].copy(), school.energy, alive, food[:, 0].copy(),
+              food[:, 1].copy(), has_food, *goals, flocking_due, rank, keys[order]]
+    if not HAVE_NUMBA:
+        # Plain Python indexes lists much faster than NumPy arrays
+        arrays = [array.tolist() for array in arrays]
+        dead = dead.tolist()
+    width, height = school.world_size
+    remaining = _move_and_feed(*arrays, float(origin[0]), float(origin[1]), float(cell_size), int(rows),
+                               float(food_amount), float(school.max_speed), float(school.max_force), float(width),
+                               float(height), dead)
+    # Food only ever drops by whole units here, so keep an integer amount an integer
+    if isinstance(food_amount, int):
+        remaining = int(remaining)
+
+    x, y, vx, vy, _, _, energy = (np.asarray(array) for array in arrays[:7])
+    school.positions[:, 0], school.positions[:, 1] = x[rank], y[rank]
+    school.velocities[:, 0], school.velocities[:, 1] = vx[rank], vy[rank]
+    school.energy[:] = energy
+    if school.flocking_goals is not None:
+        for k, array in enumerate(school.flocking_goals):
+            array[:, 0], array[:, 1] = arrays[11 + 2 * k], arrays[12 + 2 * k]
+    return remaining, np.asarray(dead, dtype=bool)[rank]
@@ -0,0 +1,38 @@
+import atexit
+import csv
+import time
+
+
+class TelemetryWriter:
+    # Keeps the CSV file open and writes rows in batches, flushing once flush_rows rows
+    # are pending or flush_interval seconds have passed, and again at close/exit
+    def __init__(self, path, fieldnames, flush_rows=500, flush_interval=5.0):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.file = open(path, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(fieldnames)
+        self.last_flush = time.monotonic()
+        atexit.register(self.close)
+
+    def write_row(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.file.closed:
+            return
+        self.writer.writerows(self.pending)
+        self.pending.clear()
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        atexit.unregister(self.close)
@@ -0,0 +1,284 @@
+import math
+import multiprocessing
+import random
+import time
+
+import numpy as np
+from pygame.math import Vector2
+
+from fish import Fish
+from lake import Lake
+from plant import PlantStore
+from plant_index import PlantIndex
+from population import FishPopulation
+from spatial_grid import SpatialGrid
+
+# Neighbor radius of Fish.alignment and Fish.cohesion: fish this close to a tile border
+# are copied to the neighboring tiles
+HALO = 50
+
+
+class TileFish:
+    # What the coordinating process knows about a fish owned by a tile worker: enough
+    # for the fishermen, the stats and drawing
+    def __init__(self, id, position, tile):
+        self.id = id
+        self.position = position
+        self.tile = tile
+
+
+class GhostFish:
+    # Copy of a fish from a neighboring tile, only seen by the steering of this tile's fish
+    def __init__(self, position, velocity):
+        self.position = Vector2(position)
+        self.velocity = Vector2(velocity)
+
+
+def fish_state(fish):
+    return (fish.id, fish.energy, tuple(fish.position), tuple(fish.velocity), tuple(fish.target),
+            fish.change_target_time, fish.max_speed, fish.max_force, fish.world_size)
+
+
+def fish_from_state(state):
+    fish_id, energy, position, velocity, target, change_target_time, max_speed, max_force, world_size = state
+    fish = Fish(id=fish_id, energy=energy, position=position, world_size=world_size)
+    fish.velocity.update(*velocity)
+    fish.target.update(*target)
+    fish.change_target_time = change_target_time
+    fish.max_speed, fish.max_force = max_speed, max_force
+    return fish
+
+
+class TileLayout:
+    # columns x rows equal tiles covering the lake; tile k is at column k % columns, row k // columns
+    def __init__(self, width, height, columns, rows):
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.rows = rows
+        self.tile_width = width / columns
+        self.tile_height = height / rows
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def bounds(self, tile):
+        column, row = tile % self.columns, tile // self.columns
+        return (column * self.tile_width, row * self.tile_height,
+                (column + 1) * self.tile_width, (row + 1) * self.tile_height)
+
+    def tile_of(self, positions):
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        columns = np.clip((positions[:, 0] // self.tile_width).astype(np.int64), 0, self.columns - 1)
+        rows = np.clip((positions[:, 1] // self.tile_height).astype(np.int64), 0, self.rows - 1)
+        return rows * self.columns + columns
+
+    def halo_of(self, tile, positions):
+        # Which positions are within HALO of the tile (by bounding box)
+        x1, y1, x2, y2 = self.bounds(tile)
+        x, y = positions[:, 0], positions[:, 1]
+        return (x1 - HALO <= x) & (x <= x2 + HALO) & (y1 - HALO <= y) & (y <= y2 + HALO)
+
+
+def tile_worker(connection, tile, layout, fish_states, seed):
+    # Owns the fish of one tile. Every step message brings the fish caught by the
+    # fishermen and the fish migrating in, copies of the fish near the border in the
+    # neighboring tiles, all plant positions, how many fish may eat and whether the
+    # fish reproduce; the reply has the new fish positions, the fish that left the tile
+    # and this tile's fish near its own border.
+    random.seed(seed)
+    population = FishPopulation(fish_from_state(state) for state in fish_states)
+    grid = SpatialGrid(cell_size=HALO)
+    x1, y1, x2, y2 = layout.bounds(tile)
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        population.extend(fish_from_state(state) for state in message['migrants'])
+        for fish_id in message['caught']:
+            fish = population.get(fish_id)
+            if fish is not None:
+                population.remove(fish)
+
+        plants = PlantStore(capacity=max(len(message['plants']), 1))
+        plants.add_many(message['plants'])
+        plant_index = PlantIndex(plants)
+
+        grid.rebuild(population)
+        for _, x, y, vx, vy in message['halo'].tolist():
+            grid.insert(GhostFish((x, y), (vx, vy)))
+        closest_food = plant_index.nearest_many([tuple(fish.position) for fish in population])
+        closest_food = {id(fish): plants[slot] for fish, slot in zip(population, closest_food) if slot >= 0}
+
+        # Same movement, feeding and death loop as Lake.update
+        food_budget = message['food_budget']
+        eaten = 0
+        for fish in population:
+            fish.move(grid.neighbors(fish.position), plants, closest_food.get(id(fish)))
+            grid.update(fish)
+            if eaten < food_budget:
+                fish.eat(1)
+                eaten += 1
+            if fish.energy <= 0:
+                population.mark_dead(fish)
+                grid.remove(fish)
+        population.compact()
+
+        # Parents are picked within the tile; ids are interleaved between tiles
+        new_fish = []
+        if message['reproduction_chance'] is not None and len(population) >= 2:
+            for fish in population:
+                if random.random() < message['reproduction_chance']:
+                    parent1, parent2 = random.sample(population, 2)
+                    new_position = (parent1.position + parent2.position) / 2
+                    fish_id = message['next_fish_id'] + tile + len(layout) * len(new_fish)
+                    new_fish.append(Fish(id=fish_id, energy=50, position=new_position,
+                                         world_size=(layout.width, layout.height)))
+        population.extend(new_fish)
+
+        boundary = [(fish.id, fish.position.x, fish.position.y, fish.velocity.x, fish.velocity.y)
+                    for fish in population
+                    if fish.position.x - x1 < HALO or x2 - fish.position.x < HALO or
+                    fish.position.y - y1 < HALO or y2 - fish.position.y < HALO]
+        positions = np.array([tuple(fish.position) for fish in population], dtype=float).reshape(-1, 2)
+        leaving = np.flatnonzero(layout.tile_of(positions) != tile)
+        emigrants = [population[slot] for slot in leaving]
+        for fish in emigrants:
+            population.remove(fish)
+
+        connection.send({
+            'ids': np.array([fish.id for fish in population], dtype=np.int64),
+            'positions': np.array([tuple(fish.position) for fish in population], dtype=float).reshape(-1, 2),
+            'emigrants': [fish_state(fish) for fish in emigrants],
+            'boundary': np.array(boundary, dtype=float).reshape(-1, 5),
+            'eaten': eaten,
+            'born': len(new_fish),
+        })
+    connection.close()
+
+
+class TiledLake(Lake):
+    # A Lake whose fish are split over columns x rows spatial tiles, each stepped by its
+    # own worker process. This process keeps the season, oxygen, food, plants, logging
+    # and fishermen as in Lake, and each step:
+    #  - gives every tile its share of the food in tile order, like the fish-by-fish
+    #    feeding of Lake.update,
+    #  - sends every tile the fish within HALO of its border in the other tiles (as of
+    #    the start of the step), the fish migrating in and the fish caught since,
+    #  - collects the new positions, the fish crossing a tile border and the births.
+    # Fish in different tiles move at the same time and parents are picked within a
+    # tile, so a run differs in detail from a single-process Lake but not in behavior.
+    def __init__(self, width, height, initial_fish, initial_food, plants, reproduction_interval, season_length,
+                 tiles=(2, 2), seed=None, **lake_options):
+        if lake_options.get('school_size') is not None:
+            raise ValueError("TiledLake workers step single fish and cannot run schools")
+        if lake_options.get('engine', 'objects') != 'objects':
+            raise ValueError(f"TiledLake workers step their fish with Fish.move and cannot use the "
+                             f"'{lake_options['engine']}' engine")
+        if lake_options.get('flocking_fraction', 1.0) < 1:
+            raise ValueError("TiledLake workers update the flocking of every fish each tick")
+        super().__init__(width, height, initial_fish, initial_food, plants, reproduction_interval, season_length,
+                         seed=seed, **lake_options)
+        self.layout = TileLayout(width, height, *tiles)
+        fish = list(self.fish_population)
+        owners = self.layout.tile_of([tuple(member.position) for member in fish])
+
+        self.connections = []
+        self.workers = []
+        for tile in range(len(self.layout)):
+            parent, child = multiprocessing.Pipe()
+            states = [fish_state(member) for member, owner in zip(fish, owners) if owner == tile]
+            worker_seed = None if seed is None else seed * len(self.layout) + tile
+            worker = multiprocessing.Process(target=tile_worker, args=(child, tile, self.layout, states, worker_seed),
+                                             daemon=True)
+            worker.start()
+            child.close()
+            self.connections.append(parent)
+            self.workers.append(worker)
+
+        self.fish_population = FishPopulation(TileFish(member.id, tuple(member.position), int(owner))
+                                              for member, owner in zip(fish, owners))
+        self.fish_population.next_fish_id = max([member.id + 1 for member in fish], default=0)
+        self.fish_tiles = {member.id: int(owner) for member, owner in zip(fish, owners)}
+        self.migrants = [[] for _ in self.workers]
+        self.route_halo(np.array([(member.id, *member.position, *member.velocity) for member in fish],
+                                 dtype=float).reshape(-1, 5))
+
+    def route_halo(self, rows):
+        owners = self.layout.tile_of(rows[:, 1:3])
+        self.halo = [rows[self.layout.halo_of(tile, rows[:, 1:3]) & (owners != tile)] for tile in range(len(self.layout))]
+
+    def update(self):
+        timer = self.timer
+        update_start = time.perf_counter()
+
+        # Fish the fishermen removed from fish_population since the last step
+        present = {fish.id for fish in self.fish_population}
+        caught = [[] for _ in self.workers]
+        for fish_id, tile in self.fish_tiles.items():
+            if fish_id not in present:
+                caught[tile].append(fish_id)
+        caught_ids = [fish_id for ids in caught for fish_id in ids]
+
+        season_name, reproduction_chance = self.update_environment()
+
+        # Every fish eats one unit while there is food left, in tile order
+        counts = np.bincount([fish.tile for fish in self.fish_population], minlength=len(self.workers))
+        food_budgets = []
+        food = self.food_amount
+        for count in counts:
+            eating = min(int(count), max(math.ceil(food), 0))
+            food_budgets.append(eating)
+            food -= eating
+        reproducing = (self.generation_count % self.reproduction_interval == 0 and food > 10 and self.oxygen_level > 10)
+
+        plant_positions = self.plants.active_positions.copy()
+        for tile, connection in enumerate(self.connections):
+            halo = self.halo[tile]
+            if caught_ids:
+                halo = halo[~np.isin(halo[:, 0], caught_ids)]
+            connection.send({
+                'caught': caught[tile],
+                'migrants': self.migrants[tile],
+                'halo': halo,
+                'plants': plant_positions,
+                'food_budget': food_budgets[tile],
+                'reproduction_chance': reproduction_chance if reproducing else None,
+                'next_fish_id': self.fish_population.next_fish_id,
+            })
+        replies = [connection.recv() for connection in self.connections]
+        timer.lap('tiles')
+
+        self.food_amount -= sum(reply['eaten'] for reply in replies)
+        born = sum(reply['born'] for reply in replies)
+        # Tile k numbered its newborns next_fish_id + k + tiles * j
+        next_fish_id = self.fish_population.next_fish_id + len(self.workers) * max(reply['born'] for reply in replies)
+        self.fish_born_per_season[season_name] += born
+        self.fish_born_this_step += born
+
+        # Collect the tiles' fish, and send the fish that crossed a border to their new tile
+        population = FishPopulation()
+        self.migrants = [[] for _ in self.workers]
+        for tile, reply in enumerate(replies):
+            for fish_id, position in zip(reply['ids'].tolist(), reply['positions'].tolist()):
+                population.add(TileFish(fish_id, tuple(position), tile))
+            for state in reply['emigrants']:
+                owner = int(self.layout.tile_of(state[2])[0])
+                self.migrants[owner].append(state)
+                population.add(TileFish(state[0], state[2], owner))
+        population.next_fish_id = max(population.next_fish_id, next_fish_id)
+        self.fish_population = population
+        self.fish_tiles = {fish.id: fish.tile for fish in population}
+        self.route_halo(np.concatenate([reply['boundary'] for reply in replies]))
+        timer.lap('reproduction')
+
+        self.finish_update(update_start)
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for worker in self.workers:
+            worker.join()
+        super().close()
@@ -0,0 +1,41 @@
+class TimerWheel:
+    # Hashed timer wheel: a key due at tick t waits in slot t % size, so each tick only
+    # looks at the keys due around then instead of counting every timer down. Keys due
+    # more than size ticks ahead stay in their slot for the extra rounds. Rescheduled or
+    # cancelled keys are dropped lazily when their old slot comes up.
+    def __init__(self, size=128):
+        self.slots = [[] for _ in range(size)]
+        self.due = {}
+
+    def __len__(self):
+        return len(self.due)
+
+    def __contains__(self, key):
+        return key in self.due
+
+    def schedule(self, key, tick):
+        self.due[key] = tick
+        self.slots[tick % len(self.slots)].append(key)
+
+    def cancel(self, key):
+        self.due.pop(key, None)
+
+    def clear(self):
+        for slot in self.slots:
+            slot.clear()
+        self.due.clear()
+
+    def pop(self, tick):
+        # Keys due at tick, in the order they were scheduled
+        slot = self.slots[tick % len(self.slots)]
+        expired = []
+        waiting = []
+        for key in slot:
+            due = self.due.get(key)
+            if due == tick:
+                expired.append(key)
+                del self.due[key]
+            elif due is not None and due > tick and due % len(self.slots) == tick % len(self.slots):
+                waiting.append(key)
+        slot[:] = waiting
+        return expired
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+# Recorded series and their storage types
+SERIES_FIELDS = {
+    'time_step': np.int64,
+    'fish_population': np.int64,
+    'food_amount': np.float64,
+    'oxygen_level': np.float64,
+    'fish_born': np.int64,
+    'fish_caught': np.int64,
+}
+
+
+class TimeSeriesStore:
+    # Typed per-series arrays that double in capacity when full, saved as one .npy file
+    # per series so they can be memory-mapped back with load_time_series
+    def __init__(self, directory, initial_capacity=4096):
+        self.directory = directory
+        self.length = 0
+        self.columns = {name: np.empty(initial_capacity, dtype=dtype) for name, dtype in SERIES_FIELDS.items()}
+
+    def __len__(self):
+        return self.length
+
+    def append(self, **values):
+        if self.length == len(self.columns['time_step']):
+            for name, column in self.columns.items():
+                grown = np.empty(2 * len(column), dtype=column.dtype)
+                grown[:self.length] = column[:self.length]
+                self.columns[name] = grown
+        for name, column in self.columns.items():
+            column[self.length] = values[name]
+        self.length += 1
+
+    def column(self, name):
+        return self.columns[name][:self.length]
+
+    def as_dict(self):
+        return {name: self.column(name) for name in self.columns}
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.columns:
+            np.save(os.path.join(self.directory, f'{name}.npy'), self.column(name))
+
+
+def load_time_series(directory, mmap_mode='r'):
+    # Memory-mapped, read-only views of the series saved by TimeSeriesStore.save
+    return {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in SERIES_FIELDS
+        if os.path.exists(os.path.join(directory, f'{name}.npy'))
+    }
+
+
+def minmax_indices(values, max_points=2000):
+    # Indices of a peak-preserving subset of values for plotting: the series is cut into
+    # max_points // 2 equal bins and the minimum and maximum of every bin are kept, plus
+    # the first and last sample
+    values = np.asarray(values, dtype=float)
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    bins = max(max_points // 2, 1)
+    bin_size = -(-count // bins)
+    padded = np.full(bins * bin_size, np.nan)
+    padded[:count] = values
+    padded = padded.reshape(bins, bin_size)
+    offsets = np.arange(bins) * bin_size
+    occupied = offsets < count
+    lows = np.nanargmin(padded[occupied], axis=1) + offsets[occupied]
+    highs = np.nanargmax(padded[occupied], axis=1) + offsets[occupied]
+    return np.unique(np.concatenate(([0, count - 1], lows, highs)))
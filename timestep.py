@@ -0,0 +1,77 @@
+import time
+
+REAL_TIME = 'real time'
+MAX_SPEED = 'max speed'
+PAUSED = 'paused'
+
+
+class StepScheduler:
+    # Decides how many simulation steps to run per rendered frame. In real time the
+    # steps follow the wall clock (ticks_per_second * speed) through an accumulator,
+    # in max speed the simulation runs for the whole frame budget, and when paused
+    # only explicitly requested single steps run.
+    def __init__(self, ticks_per_second=60, speed=1.0, mode=REAL_TIME, frame_budget=1 / 30, max_catch_up=8):
+        self.ticks_per_second = ticks_per_second
+        self.speed = speed
+        self.mode = mode
+        self.frame_budget = frame_budget
+        self.max_catch_up = max_catch_up
+        self.accumulator = 0.0
+        self.requested_steps = 0
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.accumulator = 0.0
+
+    def toggle_pause(self):
+        self.set_mode(REAL_TIME if self.mode == PAUSED else PAUSED)
+
+    def toggle_max_speed(self):
+        self.set_mode(REAL_TIME if self.mode == MAX_SPEED else MAX_SPEED)
+
+    def step_once(self):
+        if self.mode == PAUSED:
+            self.requested_steps += 1
+
+    def faster(self):
+        self.speed = min(self.speed * 2, 64)
+
+    def slower(self):
+        self.speed = max(self.speed / 2, 1 / 16)
+
+    def describe(self):
+        return f"{self.mode} x{self.speed:g}" if self.mode == REAL_TIME else self.mode
+
+    def run_frame(self, step, frame_seconds):
+        # Run the steps due for a frame that took frame_seconds; returns how many ran
+        if self.mode == PAUSED:
+            steps, self.requested_steps = self.requested_steps, 0
+            for _ in range(steps):
+                step()
+            return steps
+
+        if self.mode == MAX_SPEED:
+            deadline = time.perf_counter() + self.frame_budget
+            steps = 0
+            while True:
+                step()
+                steps += 1
+                if time.perf_counter() >= deadline:
+                    return steps
+
+        self.accumulator += frame_seconds * self.ticks_per_second * self.speed
+        steps = int(self.accumulator)
+        self.accumulator -= steps
+        limit = max(1, int(self.max_catch_up * self.speed))
+        if steps > limit:
+            # Too far behind: drop the backlog instead of spiralling
+            steps = limit
+            self.accumulator = 0.0
+        deadline = time.perf_counter() + self.frame_budget
+        for done in range(steps):
+            step()
+            if time.perf_counter() >= deadline:
+                # Keep the window responsive; the rest carries over to the next frame
+                self.accumulator = min(self.accumulator + steps - done - 1, limit)
+                return done + 1
+        return steps